@@ -1,22 +1,63 @@
 import json
+from datetime import timezone
 from typing import Any, Dict, Optional
 
 from sqlalchemy import text
-from app.db import engine
-
-
-async def track_event(user_id: int, event_name: str, props: Optional[Dict[str, Any]] = None) -> None:
-    props = props or {}
-
-    async with engine.begin() as conn:
-        await conn.execute(
-            text("""
-                INSERT INTO events (user_id, event_name, props)
-                VALUES (:user_id, :event_name, CAST(:props AS jsonb))
-            """),
-            {
-                "user_id": user_id,
-                "event_name": event_name,
-                "props": json.dumps(props),
-            },
-        )
+from app.db import get_engine
+from app.dates import utc_now
+
+RELAY_BATCH = 5000
+
+OUTBOX_INSERT_SQL = text("""
+    INSERT INTO events_outbox (user_id, event_name, ts_utc, props)
+    VALUES (:user_id, :event_name, :ts_utc, CAST(:props AS jsonb))
+""")
+
+# Перенос одним выражением: удалённое из outbox и вставленное в events
+# фиксируются вместе, поэтому событие не теряется и не дублируется.
+RELAY_SQL = text("""
+    WITH moved AS (
+      DELETE FROM events_outbox
+      WHERE id IN (
+        SELECT id FROM events_outbox ORDER BY id LIMIT :limit FOR UPDATE SKIP LOCKED
+      )
+      RETURNING id, user_id, event_name, ts_utc, props
+    )
+    INSERT INTO events (user_id, event_name, ts_utc, props)
+    SELECT user_id, event_name, ts_utc, props FROM moved ORDER BY id
+""")
+
+# Переносы идут строго по одному: id в events выдаются и фиксируются в одном
+# порядке, и export_events может продолжать с last_id (id > :after), не теряя
+# строк, которые параллельный перенос получил раньше, а зафиксировал позже.
+RELAY_LOCK_SQL = text("SELECT pg_advisory_xact_lock(:key)")
+RELAY_LOCK_KEY = 0x6576656E7473  # 'events'
+
+OUTBOX_DEPTH_SQL = text("SELECT count(*) FROM events_outbox")
+
+
+async def add_event(session, user_id: int, event_name: str, props: Optional[Dict[str, Any]] = None) -> None:
+    """Пишет событие в outbox в транзакции вызывающего: commit один на действие и событие."""
+    await session.execute(OUTBOX_INSERT_SQL, {
+        "user_id": user_id,
+        "event_name": event_name,
+        "ts_utc": utc_now().replace(tzinfo=timezone.utc),
+        "props": json.dumps(props or {}),
+    })
+
+
+async def relay_outbox(batch: int = RELAY_BATCH) -> int:
+    """Переносит накопившиеся события в events пачками, возвращает сколько перенесено."""
+    total = 0
+    while True:
+        async with get_engine().begin() as conn:
+            await conn.execute(RELAY_LOCK_SQL, {"key": RELAY_LOCK_KEY})
+            moved = (await conn.execute(RELAY_SQL, {"limit": batch})).rowcount
+        total += moved
+        if moved < batch:
+            return total
+
+
+async def outbox_depth() -> int:
+    async with get_engine().connect() as conn:
+        return (await conn.execute(OUTBOX_DEPTH_SQL)).scalar_one()
@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from zoneinfo import ZoneInfo
+
+import asyncpg
+from sqlalchemy import text
+
+from app.config import load_config
+from app.dates import utc_now
+from app.db import SessionLocal, init_db
+from app.handlers import ack_reminder, user_subscriptions_stmt
+from app.reminder_queue import CLAIM_SQL, asyncpg_dsn, statement_cache_size
+from app.seed import SEED_USER_BASE
+from app.worker import BATCH, rollover_stmt
+
+cfg = load_config()
+
+# Повторяемые замеры горячих запросов на датасете из app.seed:
+#   python -m app.seed --users 100000 --subs 1000000
+#   python -m app.bench --save-baseline      # зафиксировать базу
+#   python -m app.bench                      # сравнить, exit 1 при регрессии
+# Все пишущие операции откатываются, датасет между прогонами не меняется.
+
+DEFAULT_BASELINE = "bench_baseline.json"
+SAMPLE_SIZE = 2000
+
+
+class Op:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: list[float] = []
+        self.rows = 0
+
+    def stats(self) -> dict:
+        lat = sorted(self.latencies)
+        total = sum(lat)
+
+        def pct(q: float) -> float:
+            return lat[min(len(lat) - 1, int(q * len(lat)))] * 1000
+
+        return {
+            "n": len(lat),
+            "p50_ms": round(pct(0.50), 3),
+            "p95_ms": round(pct(0.95), 3),
+            "p99_ms": round(pct(0.99), 3),
+            "rows_per_sec": round(self.rows / total, 1) if total else 0.0,
+        }
+
+
+async def _timed(op: Op, coro) -> None:
+    t0 = time.perf_counter()
+    rows = await coro
+    op.latencies.append(time.perf_counter() - t0)
+    op.rows += rows
+
+
+async def _sample_users(rng: random.Random) -> list[int]:
+    async with SessionLocal() as s:
+        ids = (await s.execute(text("""
+            SELECT user_id FROM users WHERE user_id >= :base ORDER BY user_id LIMIT :n
+        """), {"base": SEED_USER_BASE, "n": SAMPLE_SIZE * 10})).scalars().all()
+    return rng.sample(list(ids), min(SAMPLE_SIZE, len(ids)))
+
+
+async def _sample_d3(rng: random.Random) -> list:
+    async with SessionLocal() as s:
+        ids = (await s.execute(text("""
+            SELECT r.id FROM reminders r
+            JOIN subscriptions s ON s.id = r.subscription_id
+            WHERE s.user_id >= :base AND r.kind = 'D3' AND r.status IN ('sent', 'pending')
+            LIMIT :n
+        """), {"base": SEED_USER_BASE, "n": SAMPLE_SIZE * 10})).scalars().all()
+    return rng.sample(list(ids), min(SAMPLE_SIZE, len(ids)))
+
+
+async def _zones() -> list[str]:
+    async with SessionLocal() as s:
+        return list((await s.execute(text("SELECT DISTINCT timezone FROM users"))).scalars().all())
+
+
+async def bench_rollover(zones: list[str]) -> int:
+    # только выборка кандидатов, как в rollover_timezone(), без изменений
+    now_utc = utc_now().replace(tzinfo=ZoneInfo("UTC"))
+    rows = 0
+    async with SessionLocal() as s:
+        for tz in zones:
+            today = now_utc.astimezone(ZoneInfo(tz or cfg.default_tz)).date()
+            rows += len((await s.execute(rollover_stmt(tz, today))).scalars().all())
+    return rows
+
+
+async def bench_claim(conn: asyncpg.Connection) -> int:
+    tr = conn.transaction()
+    await tr.start()
+    try:
+        return len(await conn.fetch(CLAIM_SQL, BATCH, utc_now()))
+    finally:
+        await tr.rollback()
+
+
+async def bench_list(user_id: int) -> int:
+    async with SessionLocal() as s:
+        return len((await s.execute(user_subscriptions_stmt(user_id))).scalars().all())
+
+
+async def bench_ack(rid) -> int:
+    async with SessionLocal() as s:
+        ok = await ack_reminder(s, rid, "D3", utc_now())
+        await s.flush()
+        await s.rollback()
+    return int(ok)
+
+
+async def run(iterations: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    users = await _sample_users(rng)
+    d3 = await _sample_d3(rng)
+    zones = await _zones()
+    if not users:
+        sys.exit("нет синтетических данных: сначала python -m app.seed")
+
+    ops = {name: Op(name) for name in ("rollover_scan", "fetch_due_claim", "cmd_list", "cb_ok_ack")}
+    conn = await asyncpg.connect(asyncpg_dsn(cfg.database_url), statement_cache_size=statement_cache_size())
+    try:
+        # прогрев: кеши Postgres и пул соединений
+        await bench_rollover(zones)
+        await bench_claim(conn)
+
+        # rollover тяжёлый (все зоны за раз), его итераций меньше
+        for _ in range(max(3, iterations // 20)):
+            await _timed(ops["rollover_scan"], bench_rollover(zones))
+        for _ in range(iterations):
+            await _timed(ops["fetch_due_claim"], bench_claim(conn))
+        for i in range(iterations):
+            await _timed(ops["cmd_list"], bench_list(users[i % len(users)]))
+        for i in range(min(iterations, len(d3))):
+            await _timed(ops["cb_ok_ack"], bench_ack(d3[i]))
+    finally:
+        await conn.close()
+
+    return {name: op.stats() for name, op in ops.items() if op.latencies}
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if cur[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {base[key]:.3f} -> {cur[key]:.3f}")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict) -> None:
+    print(f"{'operation':18s} {'n':>5s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'rows/s':>10s}  vs base p50")
+    for name, st in results.items():
+        base = baseline.get(name)
+        delta = f"{(st['p50_ms'] / base['p50_ms'] - 1) * 100:+.0f}%" if base and base["p50_ms"] else "—"
+        print(f"{name:18s} {st['n']:5d} {st['p50_ms']:9.3f} {st['p95_ms']:9.3f} {st['p99_ms']:9.3f} "
+              f"{st['rows_per_sec']:10.1f}  {delta}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк горячих запросов на синтетическом датасете")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p50/p95, доля")
+    args = parser.parse_args()
+
+    init_db("cli")
+    results = await run(args.iterations, args.seed)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved: {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("REGRESSION:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
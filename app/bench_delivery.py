@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import time
+
+from app import metrics
+from app.bench_queue import BENCH_USER_ID, cleanup, seed_reminders
+from app.config import load_config
+from app.db import init_db
+from app.fake_telegram import FakeTelegram
+from app.ratelimit import RateLimiter
+from app.reminder_queue import ReminderQueue
+from app.tgclient import create_bot
+from app.worker import deliver_batch, fetch_due_reminders
+
+cfg = load_config()
+
+# Сквозная пропускная способность воркера: claim -> hydrate -> sendMessage -> UPDATE,
+# только вместо Telegram — app.fake_telegram в этом же процессе.
+# Запуск на локальной БД:
+#   python -m app.bench_delivery --n 2000 --latency-ms 40 --limit-rate 30 --flood-rate 0.01
+# Напоминания создаются уже просроченными; lag — от этого момента до приёма фейковым API.
+
+POLL_SECONDS = 0.1
+
+PENDING_SQL = """
+    SELECT count(*) FROM reminders r
+    JOIN subscriptions s ON s.id = r.subscription_id
+    WHERE s.user_id = $1 AND r.status IN ('pending', 'sending')
+"""
+
+
+async def drain(bot, limiter: RateLimiter, queue: ReminderQueue, timeout: float) -> None:
+    # тот же цикл, что worker.loop(), без rollover/статистики и с короткой паузой
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ids = await fetch_due_reminders(queue)
+        if ids:
+            await deliver_batch(bot, limiter, queue, ids)
+            continue
+        if not await queue.pool.fetchval(PENDING_SQL, BENCH_USER_ID):
+            return
+        await asyncio.sleep(POLL_SECONDS)
+    raise TimeoutError("очередь не разобрана за отведённое время")
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Доставка напоминаний через фейковый Bot API")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate", type=float, default=cfg.send_rate_per_sec, help="RateLimiter воркера, msg/s")
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--blocked-rate", type=float, default=0.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--limit-rate", type=float, default=30.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    init_db("worker")
+    fake = FakeTelegram(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        blocked_rate=args.blocked_rate, flood_rate=args.flood_rate, limit_rate=args.limit_rate,
+        retry_after=args.retry_after,
+    )
+    runner = await fake.start("127.0.0.1", args.port)
+    bot = create_bot(f"http://127.0.0.1:{args.port}")
+    limiter = RateLimiter(args.rate)
+    queue = await ReminderQueue.connect()
+    before = dict(metrics.reminder_sends.values)
+
+    try:
+        due_at = time.time()
+        ids = {str(i) for i in await seed_reminders(args.n, status="pending")}
+        t0 = time.perf_counter()
+        await drain(bot, limiter, queue, args.timeout)
+        wall = time.perf_counter() - t0
+    finally:
+        await cleanup()
+        await queue.close()
+        await bot.session.close()
+        await runner.cleanup()
+
+    lags = [ts - due_at for ts, _, data in fake.delivered if data.rsplit(":", 1)[-1] in ids]
+    outcomes = {k[0]: v - before.get(k, 0.0) for k, v in metrics.reminder_sends.values.items()}
+
+    print(f"reminders {args.n} in {wall:.1f} s: {len(lags) / wall:.1f} delivered/s "
+          f"(limiter {args.rate:g}/s, api latency {args.latency_ms:g}+{args.jitter_ms:g} ms)")
+    print("outcomes: " + ", ".join(f"{k} {int(v)}" for k, v in sorted(outcomes.items()) if v))
+    print(f"end-to-end lag: p50 {_pct(lags, 0.5):.2f} s, p95 {_pct(lags, 0.95):.2f} s, max {max(lags, default=0):.2f} s")
+    print("fake API calls: " + ", ".join(f"{m} {s}: {n}" for (m, s), n in sorted(fake.calls.items())))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
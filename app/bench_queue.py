@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from app.db import SessionLocal, init_db
+from app.models import Reminder, Subscription, User
+from app.reminder_queue import ReminderQueue
+from app.render import reminder_text
+from app.keyboards import ok_kb
+
+# Сравнение CPU на одно доставленное напоминание: прежний ORM-путь воркера
+# (s.get + dirty tracking + commit на каждое) против ReminderQueue на asyncpg.
+# Telegram не вызывается, текст и клавиатура собираются в обоих вариантах.
+# Запуск на локальной БД: python -m app.bench_queue --n 2000
+
+BENCH_USER_ID = -424242
+
+
+async def seed_reminders(n: int, status: str = "sending") -> list[uuid.UUID]:
+    async with SessionLocal() as s:
+        if not await s.get(User, BENCH_USER_ID):
+            s.add(User(user_id=BENCH_USER_ID, timezone="UTC"))
+        sub = Subscription(
+            user_id=BENCH_USER_ID, name="bench", amount="9.99", currency="EUR",
+            billing_period="monthly", charge_day=1, next_charge_date=date.today(), is_active=True,
+        )
+        s.add(sub)
+        await s.flush()
+        reminders = [
+            Reminder(
+                subscription_id=sub.id, kind="D1" if i % 2 else "D3",
+                charge_date=date.today() + timedelta(days=i),
+                remind_at_utc=datetime.utcnow(), status=status, attempts=0,
+            )
+            for i in range(n)
+        ]
+        s.add_all(reminders)
+        await s.commit()
+        return [r.id for r in reminders]
+
+
+async def cleanup():
+    async with SessionLocal() as s:
+        sub_ids = select(Subscription.id).where(Subscription.user_id == BENCH_USER_ID)
+        await s.execute(delete(Reminder).where(Reminder.subscription_id.in_(sub_ids)))
+        await s.execute(delete(Subscription).where(Subscription.user_id == BENCH_USER_ID))
+        await s.execute(delete(User).where(User.user_id == BENCH_USER_ID))
+        await s.commit()
+
+
+async def _orm_deliver(reminder_id):
+    # дословно логика прежнего send_one(), без самого bot.send_message
+    async with SessionLocal() as s:
+        r = await s.get(Reminder, reminder_id)
+        if not r or r.status != "sending":
+            return
+        sub = await s.get(Subscription, r.subscription_id)
+        if not sub or sub.deleted_at is not None or not sub.is_active:
+            r.status = "canceled"
+            await s.commit()
+            return
+        if r.kind == "D1":
+            d3 = (await s.execute(
+                select(Reminder).where(
+                    Reminder.subscription_id == r.subscription_id,
+                    Reminder.charge_date == r.charge_date,
+                    Reminder.kind == "D3",
+                )
+            )).scalars().first()
+            if d3 and d3.acked_at is not None:
+                r.status = "canceled"
+                await s.commit()
+                return
+        reminder_text(r.kind, sub.name, str(sub.amount), sub.currency, r.charge_date)
+        ok_kb(r.kind, str(r.id))
+        r.status = "sent"
+        await s.commit()
+
+
+async def _fast_deliver(queue: ReminderQueue, ids, batch: int):
+    for i in range(0, len(ids), batch):
+        rows = await queue.hydrate(ids[i:i + batch])
+        sent = []
+        for r in rows:
+            if not r["sub_ok"] or r["d3_acked"]:
+                continue
+            reminder_text(r["kind"], r["name"], r["amount"], r["currency"], r["charge_date"])
+            ok_kb(r["kind"], str(r["id"]))
+            sent.append(r["id"])
+        await queue.mark_sent(sent)
+
+
+async def _measure(label: str, n: int, coro_factory) -> float:
+    ids = await seed_reminders(n)
+    try:
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        await coro_factory(ids)
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    finally:
+        await cleanup()
+    print(f"{label:8s} {n} reminders: cpu {cpu / n * 1e6:8.1f} µs/reminder, wall {wall / n * 1e6:8.1f} µs/reminder")
+    return cpu / n
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="CPU на доставку напоминания: ORM vs asyncpg")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    init_db("cli")
+
+    async def orm(ids):
+        for rid in ids:
+            await _orm_deliver(rid)
+
+    queue = await ReminderQueue.connect()
+    try:
+        orm_cpu = await _measure("orm", args.n, orm)
+        fast_cpu = await _measure("asyncpg", args.n, lambda ids: _fast_deliver(queue, ids, args.batch))
+    finally:
+        await queue.close()
+
+    print(f"CPU per reminder: x{orm_cpu / fast_cpu:.1f} less with asyncpg")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from app import keyboards, render
+from app.texts import fmt_date
+
+# CPU на отрисовку ответа: текст + клавиатура + сериализация SendMessage так,
+# как её делает aiogram перед отправкой. Без БД и сети:
+#   python -m app.bench_render --iterations 20000 --subs 15
+# «before» — прежний код (InlineKeyboardBuilder на каждый вызов, f-строки
+# в хендлерах), «after» — app.render и keyboards на его основе.
+
+
+# --- прежняя отрисовка (до app.render), для сравнения ---
+
+def _legacy_main_menu_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="➕ Добавить подписку", callback_data="menu:add")
+    kb.button(text="📋 Все мои подписки", callback_data="menu:list")
+    kb.button(text="🗓 Ближайшие списания", callback_data="menu:upcoming")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def _legacy_list_actions_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="⚙️ Управлять подписками", callback_data="subs:manage")
+    kb.button(text="➕ Добавить", callback_data="menu:add")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def _legacy_ok_kb(kind: str, reminder_id: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="✅ Ок", callback_data=f"ok:{kind}:{reminder_id}")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def _legacy_sub_card_kb(sub_id: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🔕 Отключить напоминания", callback_data=f"sub:disable:{sub_id}")
+    kb.button(text="🗑 Удалить из списка", callback_data=f"sub:delete:{sub_id}")
+    kb.button(text="📎 Как отменить в сервисе", callback_data=f"sub:how:{sub_id}")
+    kb.button(text="↩️ Назад", callback_data="subs:manage")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def _legacy_list_text(subs) -> str:
+    totals: dict[str, dict[str, Decimal]] = {}
+    lines = []
+    active_count = 0
+    for i, sub in enumerate(subs, 1):
+        status = " (выкл. напоминания)" if not sub.is_active else ""
+        if sub.is_active:
+            active_count += 1
+        if sub.billing_period == "monthly":
+            date_info = f"{sub.charge_day}"
+            per = "мес"
+        else:
+            date_info = f"{sub.charge_dom:02d}.{sub.charge_month:02d}"
+            per = "год"
+        lines.append(f"{i}) {sub.name} — {sub.amount} {sub.currency} / {per} ({date_info}){status}")
+        cur = sub.currency
+        totals.setdefault(cur, {"monthly": Decimal("0"), "yearly": Decimal("0")})
+        if sub.is_active:
+            if sub.billing_period == "monthly":
+                totals[cur]["monthly"] += Decimal(str(sub.amount))
+            else:
+                totals[cur]["yearly"] += Decimal(str(sub.amount))
+    msg = [f"**Активные подписки ({active_count}):**"]
+    msg.extend(lines)
+    msg.append("\n**Итого (по валютам):**")
+    for cur, t in totals.items():
+        monthly = t["monthly"]
+        yearly = t["yearly"]
+        yearly_equiv = (yearly / Decimal("12")) if yearly != 0 else Decimal("0")
+        grand_year = monthly * Decimal("12") + yearly
+        msg.append(f"- {cur}: {monthly:.2f}/мес + {yearly:.2f}/год (≈ {yearly_equiv:.2f}/мес), в год: {grand_year:.2f}")
+    return "\n".join(msg)
+
+
+def _legacy_card_text(sub) -> str:
+    if sub.billing_period == "monthly":
+        date_info = f"{sub.charge_day} числа"
+        per = "ежемесячно"
+    else:
+        date_info = f"{sub.charge_dom:02d}.{sub.charge_month:02d}"
+        per = "раз в год"
+    status = "Активна" if sub.is_active else "Напоминания выключены"
+    return (
+        f"**{sub.name}**\n"
+        f"Цена: {sub.amount} {sub.currency}\n"
+        f"Период: {per}\n"
+        f"Дата списания: {date_info}\n"
+        f"Статус: {status}"
+    )
+
+
+def _legacy_reminder_text(kind: str, name: str, amount: str, currency: str, charge_date: date) -> str:
+    when = "Через 3 дня" if kind == "D3" else "Завтра"
+    return (
+        f"{when} списание: **{name} — {amount} {currency}**\n"
+        f"Дата: **{fmt_date(charge_date)}**\n\n"
+        "Бот напоминает о списании. Отменить подписку можно только в самом сервисе."
+    )
+
+
+# --- сценарии: что бот рисует на один апдейт ---
+
+def _random_subs(n: int, rng: random.Random) -> list:
+    names = ["Netflix", "Spotify", "iCloud", "VPN", "YouTube Premium", "Кинопоиск", "Notion", "ChatGPT"]
+    subs = []
+    for _ in range(n):
+        monthly = rng.random() < 0.8
+        subs.append(SimpleNamespace(
+            id=uuid.uuid4(), name=rng.choice(names), amount=Decimal(f"{rng.uniform(1, 30):.2f}"),
+            currency=rng.choice(("EUR", "USD", "RUB")), is_active=rng.random() < 0.9,
+            billing_period="monthly" if monthly else "yearly",
+            charge_day=rng.randint(1, 31), charge_month=rng.randint(1, 12), charge_dom=rng.randint(1, 28),
+        ))
+    return subs
+
+
+def scenarios(subs: list) -> dict:
+    sub = subs[0]
+    sid, rid = str(sub.id), str(uuid.uuid4())
+    charge = date(2027, 3, 1)
+    amount = str(sub.amount)
+    return {
+        "menu": (
+            lambda: ("Выбери действие:", _legacy_main_menu_kb()),
+            lambda: ("Выбери действие:", keyboards.main_menu_kb()),
+        ),
+        "list": (
+            lambda: (_legacy_list_text(subs), _legacy_list_actions_kb()),
+            lambda: ("\n".join(render.subscription_list(subs)[0]), keyboards.list_actions_kb()),
+        ),
+        "card": (
+            lambda: (_legacy_card_text(sub), _legacy_sub_card_kb(sid)),
+            lambda: (render.subscription_card(sub), keyboards.sub_card_kb(sid)),
+        ),
+        "reminder": (
+            lambda: (_legacy_reminder_text("D3", sub.name, amount, sub.currency, charge), _legacy_ok_kb("D3", rid)),
+            lambda: (render.reminder_text("D3", sub.name, amount, sub.currency, charge), keyboards.ok_kb("D3", rid)),
+        ),
+    }
+
+
+def serialize(bot: Bot, session: AiohttpSession, text_: str, markup) -> dict:
+    # то же, что AiohttpSession.build_form_data(), без FormData
+    method = SendMessage(chat_id=1, text=text_, reply_markup=markup, parse_mode="Markdown")
+    return {k: session.prepare_value(v, bot=bot, files={}) for k, v in method.model_dump(warnings=False).items()}
+
+
+def _cpu_per_call(fn, iterations: int) -> float:
+    cpu0 = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - cpu0) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU на отрисовку ответа: до и после app.render")
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--subs", type=int, default=15, help="подписок в /list")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    session = AiohttpSession()
+    bot = Bot("123:abc", session=session)
+    subs = _random_subs(args.subs, random.Random(args.seed))
+
+    # без спецсимвола Markdown в полях результат обязан совпасть байт в байт
+    mismatched = []
+    for name, (before, after) in scenarios(subs).items():
+        if serialize(bot, session, *before()) != serialize(bot, session, *after()):
+            mismatched.append(name)
+    if mismatched:
+        sys.exit(f"FAIL: rendering differs from the previous code for {', '.join(mismatched)}")
+
+    print(f"{'update':10s} {'render before':>14s} {'after':>8s} {'+ serialize before':>19s} {'after':>8s} {'saved':>8s}")
+    for name, (before, after) in scenarios(subs).items():
+        r_before = _cpu_per_call(before, args.iterations)
+        r_after = _cpu_per_call(after, args.iterations)
+        s_before = _cpu_per_call(lambda: serialize(bot, session, *before()), args.iterations)
+        s_after = _cpu_per_call(lambda: serialize(bot, session, *after()), args.iterations)
+        print(f"{name:10s} {r_before * 1e6:11.1f} µs {r_after * 1e6:5.1f} µs "
+              f"{s_before * 1e6:16.1f} µs {s_after * 1e6:5.1f} µs {(s_before - s_after) * 1e6:5.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
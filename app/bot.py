@@ -17,6 +17,11 @@ from aiogram.types import BotCommand
 
 from app.config import load_config
 from app.handlers import setup as setup_handlers
+from app.middlewares import setup as setup_middlewares
+from app import ics, metrics
+from app.db import init_db, liveness_loop
+from app.profiling import ApiTimingMiddleware
+from app.tgclient import create_bot
 
 cfg = load_config()
 
@@ -26,7 +31,14 @@ async def setup_bot_commands(bot: Bot):
     await bot.set_my_commands([
         BotCommand(command="start", description="Открыть меню"),
         BotCommand(command="add", description="Добавить подписку"),
+        BotCommand(command="import", description="Импорт списка подписок"),
         BotCommand(command="list", description="Все мои подписки"),
+        BotCommand(command="find", description="Найти подписку"),
+        BotCommand(command="upcoming", description="Ближайшие списания"),
+        BotCommand(command="forecast", description="Прогноз трат"),
+        BotCommand(command="currency", description="Валюта для общей суммы"),
+        BotCommand(command="calendar", description="Календарь списаний"),
+        BotCommand(command="tz", description="Часовой пояс"),
         BotCommand(command="help", description="Помощь"),
     ])
 
@@ -52,6 +64,7 @@ async def run_webhook(bot: Bot, dp: Dispatcher):
         return web.Response(text="ok")
 
     app.router.add_post(cfg.webhook_path, handle_update)
+    ics.setup_routes(app)
 
     url = cfg.webhook_base.rstrip("/") + cfg.webhook_path
     await bot.set_webhook(
@@ -71,17 +84,27 @@ async def run_webhook(bot: Bot, dp: Dispatcher):
 
 
 async def main():
-    bot = Bot(token=cfg.bot_token)
+    init_db("bot")
+    bot = create_bot()
+    bot.session.middleware(ApiTimingMiddleware())
     dp = Dispatcher()
+    setup_middlewares(dp)
     setup_handlers(dp)
 
     # ВАЖНО: команды выставляем до старта polling/webhook
     await setup_bot_commands(bot)
-
-    if cfg.mode == "webhook":
-        await run_webhook(bot, dp)
-    else:
-        await run_polling(bot, dp)
+    if cfg.metrics_port:
+        await metrics.start_server(cfg.metrics_host, cfg.metrics_port)
+    # вместо pool_pre_ping: фоновая проверка соединений пула
+    liveness = asyncio.create_task(liveness_loop())
+
+    try:
+        if cfg.mode == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        liveness.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import SessionLocal, Wakeup, notify_worker
+from app.models import Broadcast, BroadcastDelivery, User
+from app.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Сколько пользователей обрабатываем между чекпоинтами. После рестарта
+# повторно получить сообщение могут максимум CHUNK человек.
+CHUNK = 200
+# /broadcast cancel проверяем внутри пачки: после отмены уйдёт не больше стольких
+CANCEL_CHECK_EVERY = 20
+IDLE_SECONDS = 30
+
+
+async def create_broadcast(text: str, created_by: int) -> int:
+    async with SessionLocal() as s:
+        b = Broadcast(text=text, created_by=created_by, status="pending")
+        s.add(b)
+        await s.flush()
+        await notify_worker(s)
+        await s.commit()
+        return b.id
+
+
+async def cancel_broadcasts() -> int:
+    async with SessionLocal() as s:
+        res = await s.execute(
+            update(Broadcast)
+            .where(Broadcast.status.in_(("pending", "running")))
+            .values(status="canceled", finished_at=datetime.utcnow())
+        )
+        await s.commit()
+        return res.rowcount
+
+
+async def latest_broadcast() -> Broadcast | None:
+    async with SessionLocal() as s:
+        return (await s.execute(
+            select(Broadcast).order_by(Broadcast.id.desc()).limit(1)
+        )).scalars().first()
+
+
+async def _next_broadcast() -> Broadcast | None:
+    async with SessionLocal() as s:
+        return (await s.execute(
+            select(Broadcast)
+            .where(Broadcast.status.in_(("pending", "running")))
+            .order_by(Broadcast.id)
+            .limit(1)
+        )).scalars().first()
+
+
+async def _send(bot: Bot, limiter: RateLimiter, user_id: int, text: str) -> tuple[str, str | None]:
+    while True:
+        await limiter.acquire(high=False)
+        try:
+            await bot.send_message(chat_id=user_id, text=text)
+            return "sent", None
+        except TelegramRetryAfter as e:
+            limiter.pause(e.retry_after)
+        except TelegramForbiddenError as e:
+            return "blocked", str(e)[:800]
+        except Exception as e:
+            return "failed", str(e)[:800]
+
+
+async def _is_active(broadcast_id: int) -> bool:
+    async with SessionLocal() as s:
+        status = (await s.execute(select(Broadcast.status).where(Broadcast.id == broadcast_id))).scalar()
+    return status in ("pending", "running")
+
+
+async def run_chunk(bot: Bot, limiter: RateLimiter, b: Broadcast) -> bool:
+    """Одна пачка пользователей после курсора. Возвращает False, когда рассылка закончилась."""
+    if not await _is_active(b.id):
+        return False
+    async with SessionLocal() as s:
+        user_ids = (await s.execute(
+            select(User.user_id)
+            .where(User.user_id > b.cursor_user_id)
+            .order_by(User.user_id)
+            .limit(CHUNK)
+        )).scalars().all()
+
+        if not user_ids:
+            await s.execute(
+                update(Broadcast).where(Broadcast.id == b.id)
+                .values(status="done", finished_at=datetime.utcnow())
+            )
+            await s.commit()
+            return False
+
+    outcomes = []
+    canceled = False
+    for i, uid in enumerate(user_ids):
+        if i and i % CANCEL_CHECK_EVERY == 0 and not await _is_active(b.id):
+            canceled = True
+            break
+        status, error = await _send(bot, limiter, uid, b.text)
+        outcomes.append({"broadcast_id": b.id, "user_id": uid, "status": status, "error": error})
+
+    sent = sum(1 for o in outcomes if o["status"] == "sent")
+    cursor = outcomes[-1]["user_id"]
+
+    # чекпоинт: итоги пачки одним INSERT и сдвиг курсора — в одной транзакции
+    async with SessionLocal() as s:
+        await s.execute(insert(BroadcastDelivery).values(outcomes).on_conflict_do_nothing())
+        await s.execute(
+            update(Broadcast)
+            .where(Broadcast.id == b.id, Broadcast.status.in_(("pending", "running")))
+            .values(
+                status="running",
+                cursor_user_id=cursor,
+                sent_count=Broadcast.sent_count + sent,
+                failed_count=Broadcast.failed_count + (len(outcomes) - sent),
+            )
+        )
+        await s.commit()
+
+    b.cursor_user_id = cursor
+    return not canceled
+
+
+async def broadcast_loop(bot: Bot, limiter: RateLimiter, wakeup: Wakeup):
+    while True:
+        try:
+            b = await _next_broadcast()
+            if not b:
+                await wakeup.wait(IDLE_SECONDS)
+                continue
+            while await run_chunk(bot, limiter, b):
+                pass
+        except Exception:
+            logger.exception("Broadcast loop failed, retrying in %ds", IDLE_SECONDS)
+            await asyncio.sleep(IDLE_SECONDS)
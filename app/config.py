@@ -7,7 +7,20 @@ load_dotenv()
 @dataclass(frozen=True)
 class Config:
     bot_token: str
+    telegram_api_base: str  # пусто — настоящий api.telegram.org
     database_url: str
+    database_direct_url: str  # мимо PgBouncer: для LISTEN; пусто — DATABASE_URL
+    db_pgbouncer: bool  # transaction pooling: без именованных prepared statements
+    db_statement_cache_size: int
+    db_pool_size_bot: int
+    db_max_overflow_bot: int
+    db_pool_size_worker: int
+    db_max_overflow_worker: int
+    db_queue_pool_min: int  # asyncpg-пул очереди напоминаний в воркере
+    db_queue_pool_max: int
+    db_pool_timeout: int
+    db_pool_recycle: int
+    db_liveness_seconds: int
     default_tz: str
     reminder_hour: int
 
@@ -17,15 +30,55 @@ class Config:
     webhook_secret: str
     web_server_host: str
     web_server_port: int
+    ics_secret: str
+    query_slow_ms: int
+    query_trace_sample: float  # доля апдейтов, для которых логируем медленные запросы
+    query_budget_strict: bool  # тестовый режим: превышение бюджета — исключение
+    profile_enabled: bool
+    profile_sample_rate: float
+    profile_slow_ms: int
+    profile_dir: str
+    metrics_port: int  # 0 — не поднимать отдельный листенер
+    metrics_host: str
 
     test_reminders: bool
     test_d3_minutes: int
     test_d1_minutes: int
 
+    admin_ids: frozenset[int]
+    send_rate_per_sec: float
+
+    throttle_rate: float  # апдейтов в секунду на пользователя
+    throttle_burst: int
+    callback_debounce_ms: int
+    inline_debounce_ms: int  # пауза в наборе, после которой отвечаем на inline-запрос
+    throttle_idle_seconds: int
+    throttle_max_users: int
+
+    fx_base: str
+    fx_rates_file: str
+    fx_ttl_seconds: int
+
+def _int_set(raw: str) -> frozenset[int]:
+    return frozenset(int(x) for x in raw.replace(" ", "").split(",") if x)
+
 def load_config() -> Config:
     return Config(
         bot_token=os.environ["BOT_TOKEN"],
+        telegram_api_base=os.getenv("TELEGRAM_API_BASE", "").strip(),
         database_url=os.environ["DATABASE_URL"],
+        database_direct_url=os.getenv("DATABASE_DIRECT_URL", "").strip(),
+        db_pgbouncer=os.getenv("DB_PGBOUNCER", "0") == "1",
+        db_statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+        db_pool_size_bot=int(os.getenv("DB_POOL_SIZE_BOT", "10")),
+        db_max_overflow_bot=int(os.getenv("DB_MAX_OVERFLOW_BOT", "10")),
+        db_pool_size_worker=int(os.getenv("DB_POOL_SIZE_WORKER", "3")),
+        db_max_overflow_worker=int(os.getenv("DB_MAX_OVERFLOW_WORKER", "2")),
+        db_queue_pool_min=int(os.getenv("DB_QUEUE_POOL_MIN", "1")),
+        db_queue_pool_max=int(os.getenv("DB_QUEUE_POOL_MAX", "4")),
+        db_pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        db_liveness_seconds=int(os.getenv("DB_LIVENESS_SECONDS", "30")),
         default_tz=os.getenv("DEFAULT_TZ", "Europe/Vilnius"),
         reminder_hour=int(os.getenv("REMINDER_HOUR", "10")),
 
@@ -35,8 +88,33 @@ def load_config() -> Config:
         webhook_secret=os.getenv("WEBHOOK_SECRET", "").strip(),
         web_server_host=os.getenv("WEB_SERVER_HOST", "0.0.0.0").strip(),
         web_server_port=int(os.getenv("WEB_SERVER_PORT", "8080")),
+        query_slow_ms=int(os.getenv("QUERY_SLOW_MS", "100")),
+        query_trace_sample=float(os.getenv("QUERY_TRACE_SAMPLE", "0.05")),
+        query_budget_strict=os.getenv("QUERY_BUDGET_STRICT", "0") == "1",
+        profile_enabled=os.getenv("PROFILE_ENABLED", "0") == "1",
+        profile_sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.05")),
+        profile_slow_ms=int(os.getenv("PROFILE_SLOW_MS", "500")),
+        profile_dir=os.getenv("PROFILE_DIR", "profiles").strip(),
+        metrics_port=int(os.getenv("METRICS_PORT", "9100")),
+        # /metrics без авторизации: по умолчанию только локально
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1").strip(),
+        ics_secret=(os.getenv("ICS_SECRET", "").strip() or os.getenv("WEBHOOK_SECRET", "").strip()),
 
         test_reminders=os.getenv("TEST_REMINDERS", "0") == "1",
         test_d3_minutes=int(os.getenv("TEST_D3_MINUTES", "3")),
         test_d1_minutes=int(os.getenv("TEST_D1_MINUTES", "1")),
+
+        admin_ids=_int_set(os.getenv("ADMIN_IDS", "")),
+        send_rate_per_sec=float(os.getenv("SEND_RATE_PER_SEC", "25")),
+
+        throttle_rate=float(os.getenv("THROTTLE_RATE", "2")),
+        throttle_burst=int(os.getenv("THROTTLE_BURST", "10")),
+        callback_debounce_ms=int(os.getenv("CALLBACK_DEBOUNCE_MS", "700")),
+        inline_debounce_ms=int(os.getenv("INLINE_DEBOUNCE_MS", "300")),
+        throttle_idle_seconds=int(os.getenv("THROTTLE_IDLE_SECONDS", "600")),
+        throttle_max_users=int(os.getenv("THROTTLE_MAX_USERS", "100000")),
+
+        fx_base=os.getenv("FX_BASE", "EUR").strip().upper(),
+        fx_rates_file=os.getenv("FX_RATES_FILE", "").strip(),
+        fx_ttl_seconds=int(os.getenv("FX_TTL_SECONDS", "300")),
     )
@@ -1,8 +1,51 @@
 ﻿from __future__ import annotations
 from datetime import date, datetime, time, timedelta
+from time import monotonic as _monotonic
 from zoneinfo import ZoneInfo
 import calendar
 
+_UTC = ZoneInfo("UTC")
+
+# какие напоминания ставим к дате списания: (kind, за сколько дней)
+REMINDER_OFFSETS = (("D3", 3), ("D1", 1))
+
+class Clock:
+    """Источник времени для бота и воркера; в симуляции подменяется через set_clock()."""
+
+    def utcnow(self) -> datetime:
+        return datetime.utcnow()
+
+    def monotonic(self) -> float:
+        return _monotonic()
+
+class SimClock(Clock):
+    """Ручные часы: время идёт только через advance()/set()."""
+
+    def __init__(self, start_utc: datetime):
+        self._now = start_utc
+        self._mono = 0.0
+
+    def utcnow(self) -> datetime:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._mono
+
+    def set(self, now_utc: datetime) -> None:
+        self._mono += max((now_utc - self._now).total_seconds(), 0.0)
+        self._now = max(self._now, now_utc)
+
+    def advance(self, delta: timedelta) -> None:
+        self.set(self._now + delta)
+
+_clock: Clock = Clock()
+
+def set_clock(clock: Clock) -> Clock:
+    """Ставит часы, возвращает прежние (чтобы вернуть их после симуляции)."""
+    global _clock
+    prev, _clock = _clock, clock
+    return prev
+
 def _last_day_of_month(y: int, m: int) -> int:
     return calendar.monthrange(y, m)[1]
 
@@ -40,6 +83,24 @@ def calc_next_charge_date_yearly(now_local: datetime, month: int, dom: int) -> d
         return candidate
     return safe_date(y + 1)
 
+def next_charge_on_or_after(
+    billing_period: str, charge_day: int | None, charge_month: int | None, charge_dom: int | None, d: date
+) -> date:
+    now_local = datetime.combine(d, time(0, 0))
+    if billing_period == "monthly":
+        return calc_next_charge_date_monthly(now_local, charge_day)
+    return calc_next_charge_date_yearly(now_local, charge_month, charge_dom)
+
+def iter_charge_dates(
+    billing_period: str, charge_day: int | None, charge_month: int | None, charge_dom: int | None,
+    start: date, end: date,
+):
+    # все даты списаний в [start, end] по тем же правилам, что и next_charge_date
+    d = next_charge_on_or_after(billing_period, charge_day, charge_month, charge_dom, start)
+    while d <= end:
+        yield d
+        d = next_charge_on_or_after(billing_period, charge_day, charge_month, charge_dom, d + timedelta(days=1))
+
 def local_remind_at_days(charge_date: date, days_before: int, reminder_hour: int, tz: str) -> datetime:
     z = ZoneInfo(tz)
     local_dt = datetime.combine(charge_date - timedelta(days=days_before), time(reminder_hour, 0), tzinfo=z)
@@ -47,7 +108,23 @@ def local_remind_at_days(charge_date: date, days_before: int, reminder_hour: int
 
 def to_utc(dt_local: datetime) -> datetime:
     # dt_local must be aware
-    return dt_local.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)  # store naive UTC
+    return dt_local.astimezone(_UTC).replace(tzinfo=None)  # store naive UTC
 
 def utc_now() -> datetime:
-    return datetime.utcnow()
+    return _clock.utcnow()
+
+def now_in(tz: str) -> datetime:
+    # aware-время в зоне пользователя по текущим часам
+    return utc_now().replace(tzinfo=_UTC).astimezone(ZoneInfo(tz))
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+def plan_reminders(charge_date: date, tz: str, reminder_hour: int, now_utc: datetime) -> list[tuple[str, datetime]]:
+    # D3/D1 к дате списания в naive UTC; уже прошедшие не ставим
+    planned = []
+    for kind, days_before in REMINDER_OFFSETS:
+        remind_utc = to_utc(local_remind_at_days(charge_date, days_before, reminder_hour, tz))
+        if remind_utc > now_utc:
+            planned.append((kind, remind_utc))
+    return planned
@@ -1,7 +1,154 @@
-﻿from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+﻿import asyncio
+import logging
+import time
+import uuid
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from app.config import load_config
+from app.metrics import InstrumentedPool
+from app import metrics, querytrace
+from app.reminder_queue import asyncpg_dsn, statement_cache_size
 
 _cfg = load_config()
+logger = logging.getLogger(__name__)
+
+# Движок создаёт init_db(role) в точке входа процесса: пул у бота и воркера
+# разный. pool_pre_ping не используем (лишний round-trip на каждую выдачу) —
+# вместо него liveness_loop() раз в DB_LIVENESS_SECONDS и pool_recycle.
+PROFILES = {
+    # хендлеры aiogram идут параллельно, на апдейт — одна сессия
+    "bot": {"pool_size": _cfg.db_pool_size_bot, "max_overflow": _cfg.db_max_overflow_bot},
+    # отправщики (напоминания, рассылка) + rollover/статистика/outbox по очереди
+    "worker": {"pool_size": _cfg.db_pool_size_worker, "max_overflow": _cfg.db_max_overflow_worker},
+    # миграции, бенчмарки, разовые скрипты
+    "cli": {"pool_size": 2, "max_overflow": 2},
+}
+
+
+def listen_enabled() -> bool:
+    # через PgBouncer (transaction pooling) LISTEN не работает
+    return not _cfg.db_pgbouncer or bool(_cfg.database_direct_url)
+
+
+def worker_connection_budget() -> int:
+    """Сколько соединений воркер может открыть: ORM-пул, asyncpg-пул очереди и LISTEN."""
+    orm = _cfg.db_pool_size_worker + _cfg.db_max_overflow_worker
+    return orm + _cfg.db_queue_pool_max + (1 if listen_enabled() else 0)
+
+
+WAKEUP_CHANNEL = "worker_wakeup"
+LISTEN_RETRY_SECONDS = 60
+
+engine: Optional[AsyncEngine] = None
+SessionLocal = async_sessionmaker(expire_on_commit=False, class_=AsyncSession)
+
+
+def connect_args() -> dict:
+    """connect_args для любого движка приложения, в т.ч. отдельного (export_events)."""
+    args = {
+        "prepared_statement_cache_size": statement_cache_size(),
+        "statement_cache_size": statement_cache_size(),
+    }
+    if _cfg.db_pgbouncer:
+        # безымянные по счётчику имена asyncpg сталкиваются между клиентами пулера
+        args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+    return args
+
+
+def init_db(role: str) -> AsyncEngine:
+    """Создаёт движок с пулом под роль процесса и привязывает к нему SessionLocal."""
+    global engine
+    if engine is not None:
+        return engine
+    engine = create_async_engine(
+        _cfg.database_url,
+        echo=False,
+        poolclass=InstrumentedPool,
+        pool_timeout=_cfg.db_pool_timeout,
+        pool_recycle=_cfg.db_pool_recycle,
+        connect_args=connect_args(),
+        **PROFILES[role],
+    )
+    querytrace.install(engine)
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+def get_engine() -> AsyncEngine:
+    if engine is None:
+        raise RuntimeError("init_db(role) не вызван в точке входа")
+    return engine
+
+
+def report_pool_stats() -> None:
+    pool = get_engine().pool
+    metrics.db_pool_connections.set(pool.checkedin(), "idle")
+    metrics.db_pool_connections.set(pool.checkedout(), "in_use")
+    metrics.db_pool_connections.set(max(pool.overflow(), 0), "overflow")
+
+
+async def liveness_loop(interval: Optional[float] = None) -> None:
+    # Postgres перезапустился или NAT/пулер оборвал простаивающие соединения:
+    # сбрасываем пул целиком, чтобы хендлеры не получали мёртвые соединения
+    interval = interval or _cfg.db_liveness_seconds
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with get_engine().connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        except Exception:
+            logger.warning("DB liveness check failed, disposing pool", exc_info=True)
+            metrics.db_liveness_failures.inc()
+            await get_engine().dispose()
+        report_pool_stats()
+
+
+async def notify_worker(session) -> None:
+    """NOTIFY в транзакции вызывающего: воркер проснётся после её commit."""
+    await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": WAKEUP_CHANNEL})
+
+
+class Wakeup:
+    """Отдельное соединение с LISTEN WAKEUP_CHANNEL (не из пула): NOTIFY будит ожидание раньше таймаута."""
+
+    def __init__(self):
+        self.event = asyncio.Event()
+        self._conn: Optional[asyncpg.Connection] = None
+        self._retry_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return listen_enabled()
+
+    async def start(self) -> None:
+        if not self.enabled:
+            logger.warning("DB_PGBOUNCER=1 без DATABASE_DIRECT_URL: LISTEN отключён, воркер только опрашивает")
+            return
+        self._retry_at = time.monotonic() + LISTEN_RETRY_SECONDS
+        url = _cfg.database_direct_url or _cfg.database_url
+        try:
+            self._conn = await asyncpg.connect(asyncpg_dsn(url), statement_cache_size=0)
+            await self._conn.add_listener(WAKEUP_CHANNEL, self._on_notify)
+        except Exception:
+            self._conn = None
+            logger.warning("LISTEN %s недоступен, воркер только опрашивает", WAKEUP_CHANNEL, exc_info=True)
+
+    def _on_notify(self, *_) -> None:
+        self.event.set()
+
+    async def wait(self, timeout: float) -> None:
+        # соединение оборвалось — переподключаемся; до тех пор работает обычный таймаут
+        if self.enabled and (self._conn is None or self._conn.is_closed()) and time.monotonic() >= self._retry_at:
+            await self.start()
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
 
-engine = create_async_engine(_cfg.database_url, echo=False, pool_pre_ping=True)
-SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async def close(self) -> None:
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import json
+import os
+from datetime import date
+from typing import Any, Dict, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import load_config
+from app.db import connect_args
+
+cfg = load_config()
+
+CHUNK_ROWS = 20_000
+STATE_FILE = "_state.json"
+
+# Продолжаем с last_id: строка с меньшим id не может появиться после уже
+# выгруженной с большим, потому что events пишет только relay_outbox, а его
+# транзакции идут по одной (RELAY_LOCK_SQL). Если в events пишет что-то ещё —
+# выгружать только при остановленной записи.
+EVENTS_SQL = text("""
+    SELECT id, user_id, event_name, ts_utc, props
+    FROM events
+    WHERE id > :after
+    ORDER BY id
+""")
+
+
+def _load_state(out_dir: str) -> Dict[str, Any]:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {"last_id": 0}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(out_dir: str, last_id: int) -> None:
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"last_id": last_id}, f)
+    os.replace(tmp, path)
+
+
+def _flatten(props: Dict[str, Any], prefix: str = "props.") -> Dict[str, str]:
+    # вложенные ключи склеиваем через точку, значения храним строками,
+    # чтобы схема колонки не зависела от типа в конкретной строке
+    out: Dict[str, str] = {}
+    for k, v in props.items():
+        key = prefix + str(k)
+        if isinstance(v, dict):
+            out.update(_flatten(v, key + "."))
+        elif v is None:
+            continue
+        elif isinstance(v, str):
+            out[key] = v
+        else:
+            out[key] = json.dumps(v, ensure_ascii=False)
+    return out
+
+
+def _write_day(out_dir: str, day: date, rows: List[Any]) -> None:
+    flat = [_flatten(r.props if isinstance(r.props, dict) else json.loads(r.props or "{}")) for r in rows]
+    prop_cols = sorted({k for f in flat for k in f})
+
+    columns = {
+        "id": pa.array([r.id for r in rows], pa.int64()),
+        "user_id": pa.array([r.user_id for r in rows], pa.int64()),
+        "event_name": pa.array([r.event_name for r in rows], pa.string()),
+        "ts_utc": pa.array([r.ts_utc for r in rows], pa.timestamp("us", tz="UTC")),
+    }
+    for col in prop_cols:
+        columns[col] = pa.array([f.get(col) for f in flat], pa.string())
+
+    part_dir = os.path.join(out_dir, f"day={day.isoformat()}")
+    os.makedirs(part_dir, exist_ok=True)
+    path = os.path.join(part_dir, f"events-{rows[0].id:012d}-{rows[-1].id:012d}.parquet")
+    tmp = path + ".tmp"
+    pq.write_table(pa.table(columns), tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def _write_chunk(out_dir: str, rows: List[Any]) -> int:
+    by_day: Dict[date, List[Any]] = {}
+    for r in rows:
+        by_day.setdefault(r.ts_utc.date(), []).append(r)
+    for day, day_rows in by_day.items():
+        _write_day(out_dir, day, day_rows)
+    return rows[-1].id
+
+
+async def export_events(out_dir: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    """Выгружает events с последнего сохранённого id. Возвращает число строк."""
+    os.makedirs(out_dir, exist_ok=True)
+    last_id = _load_state(out_dir)["last_id"]
+    total = 0
+
+    # отдельное соединение без пула, чтобы не отнимать коннекты у бота
+    engine = create_async_engine(cfg.database_url, poolclass=NullPool, connect_args=connect_args())
+    try:
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                EVENTS_SQL.execution_options(yield_per=chunk_rows),
+                {"after": last_id},
+            )
+            async for rows in result.partitions(chunk_rows):
+                last_id = _write_chunk(out_dir, rows)
+                _save_state(out_dir, last_id)
+                total += len(rows)
+    finally:
+        await engine.dispose()
+
+    return total
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Выгрузка events в Parquet по дням")
+    parser.add_argument("--out", default="exports/events")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    total = await export_events(args.out, args.chunk)
+    print(f"exported {total} rows -> {args.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Локальная подмена Bot API для нагрузочных тестов воркера и бота:
+#   python -m app.fake_telegram --port 8081 --latency-ms 40 --limit-rate 30
+#   TELEGRAM_API_BASE=http://127.0.0.1:8081 python -m app.worker
+# Отвечает как Telegram на методы, которые мы вызываем, и умеет тормозить,
+# сыпать ошибками и отдавать 429 retry_after. GET /_stats — счётчики.
+
+logger = logging.getLogger(__name__)
+
+
+class FakeTelegram:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        blocked_rate: float = 0.0,
+        flood_rate: float = 0.0,
+        limit_rate: float = 0.0,
+        retry_after: int = 1,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.blocked_rate = blocked_rate
+        self.flood_rate = flood_rate  # доля случайных 429 сверх лимита
+        self.limit_rate = limit_rate  # глобальный лимит sendMessage в секунду, 0 — без лимита
+        self.retry_after = retry_after
+
+        self.calls: Counter = Counter()  # (method, http status) -> число
+        self.delivered: list[tuple[float, int, str]] = []  # (time.time(), chat_id, callback_data)
+        self._message_id = 0
+        self._tokens = max(limit_rate, 1.0)
+        self._updated = time.monotonic()
+        self._flood_until = 0.0
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.delivered.clear()
+
+    def _over_limit(self) -> bool:
+        now = time.monotonic()
+        if now < self._flood_until:
+            return True
+        if not self.limit_rate:
+            return False
+        self._tokens = min(self.limit_rate, self._tokens + (now - self._updated) * self.limit_rate)
+        self._updated = now
+        if self._tokens < 1:
+            # как настоящий Telegram: после 429 запросы отбиваются, пока не пройдёт retry_after
+            self._flood_until = now + self.retry_after
+            return True
+        self._tokens -= 1
+        return False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await _read_params(request)
+
+        if method.lower() == "getupdates":
+            # long polling: держим запрос, как настоящий сервер без апдейтов
+            await asyncio.sleep(min(float(params.get("timeout") or 0), 10))
+
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        handler = getattr(self, "_m_" + method.lower(), self._m_default)
+        status, payload = handler(params)
+        self.calls[(method, status)] += 1
+        return web.json_response(payload, status=status)
+
+    # --- методы Bot API ---
+
+    def _m_sendmessage(self, params: dict):
+        if (self.flood_rate and random.random() < self.flood_rate) or self._over_limit():
+            return _error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        r = random.random()
+        if r < self.blocked_rate:
+            return _error(403, "Forbidden: bot was blocked by the user")
+        if r < self.blocked_rate + self.error_rate:
+            return _error(400, "Bad Request: chat not found")
+
+        chat_id = int(params.get("chat_id", 0))
+        self._message_id += 1
+        self.delivered.append((time.time(), chat_id, _first_callback_data(params.get("reply_markup"))))
+        return 200, {"ok": True, "result": {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }}
+
+    def _m_getme(self, params: dict):
+        return 200, {"ok": True, "result": {
+            "id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot",
+        }}
+
+    def _m_getupdates(self, params: dict):
+        return 200, {"ok": True, "result": []}
+
+    def _m_default(self, params: dict):
+        # setMyCommands, answerCallbackQuery, setWebhook, deleteWebhook...
+        return 200, {"ok": True, "result": True}
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": {f"{m} {s}": n for (m, s), n in sorted(self.calls.items())},
+            "delivered": len(self.delivered),
+        })
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/_stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str, port: int) -> web.AppRunner:
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def _error(code: int, description: str, retry_after: int | None = None):
+    payload = {"ok": False, "error_code": code, "description": description}
+    if retry_after is not None:
+        payload["parameters"] = {"retry_after": retry_after}
+    return code, payload
+
+
+async def _read_params(request: web.Request) -> dict:
+    # aiogram шлёт form-data, сложные поля (reply_markup) — JSON-строкой
+    if request.content_type == "application/json":
+        return await request.json()
+    return {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+
+
+def _first_callback_data(markup) -> str:
+    if not markup:
+        return ""
+    try:
+        data = json.loads(markup) if isinstance(markup, str) else markup
+        return data["inline_keyboard"][0][0].get("callback_data", "")
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ""
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Фейковый Telegram Bot API для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля 400 chat not found")
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="доля 403 bot was blocked")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля случайных 429")
+    parser.add_argument("--limit-rate", type=float, default=30.0, help="sendMessage в секунду до 429, 0 — без лимита")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    fake = FakeTelegram(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        blocked_rate=args.blocked_rate, flood_rate=args.flood_rate, limit_rate=args.limit_rate,
+        retry_after=args.retry_after,
+    )
+    await fake.start(args.host, args.port)
+    logger.info("fake Bot API on http://%s:%d (TELEGRAM_API_BASE)", args.host, args.port)
+    while True:
+        await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
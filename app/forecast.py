@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+from datetime import date
+from typing import Dict, Iterable, Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+from app.db import get_engine, init_db
+from app.dates import utc_now
+
+CHUNK_ROWS = 50_000
+
+# Колонки, из которых строится прогноз. Всё, что можно, считаем в SQL,
+# чтобы в Python не было поштучной обработки строк.
+FORECAST_COLUMNS = """
+    (billing_period = 'monthly') AS is_monthly,
+    COALESCE(charge_day, charge_dom) AS day,
+    COALESCE(charge_month, 0) AS month,
+    GREATEST(next_charge_date, CAST(:today AS date)) AS start,
+    CAST(round(amount * 100) AS bigint) AS cents,
+    currency
+"""
+
+USER_SQL = text(f"""
+    SELECT {FORECAST_COLUMNS}
+    FROM subscriptions
+    WHERE user_id = :user_id AND deleted_at IS NULL AND is_active
+""")
+
+FLEET_SQL = text(f"""
+    SELECT {FORECAST_COLUMNS}
+    FROM subscriptions
+    WHERE deleted_at IS NULL AND is_active
+""")
+
+
+def month_starts(today: date, months: int) -> list[date]:
+    base = np.datetime64(today, "M")
+    return [d.astype(date) for d in (base + np.arange(months)).astype("datetime64[D]")]
+
+
+def expand(
+    is_monthly: np.ndarray, day: np.ndarray, month: np.ndarray, start: np.ndarray,
+    today: date, months: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Даты списаний (N, months) и маска «списание есть» для N подписок.
+
+    Правила те же, что в calc_next_charge_date_monthly/yearly: день зажимается
+    до последнего дня месяца (31 -> 30/28, 29 Feb -> 28 Feb в невисокосный год).
+    """
+    ym = np.datetime64(today, "M") + np.arange(months)
+    month_of_year = ym.astype(np.int64) % 12 + 1
+    first_day = ym.astype("datetime64[D]")
+    days_in_month = ((ym + 1).astype("datetime64[D]") - first_day).astype(np.int64)
+
+    clamped = np.minimum(day[:, None], days_in_month[None, :])
+    dates = first_day[None, :] + (clamped - 1)
+
+    mask = is_monthly[:, None] | (month[:, None] == month_of_year[None, :])
+    mask &= dates >= start[:, None]
+    return dates, mask
+
+
+def aggregate(rows: Sequence[Sequence], today: date, months: int, out: Dict[str, np.ndarray]) -> None:
+    """Добавляет в out (валюта -> сумма в центах по месяцам) вклад пачки строк FORECAST_COLUMNS."""
+    if not rows:
+        return
+    is_monthly, day, month, start, cents, currency = zip(*rows)
+    _, mask = expand(
+        np.array(is_monthly, dtype=bool),
+        np.array(day, dtype=np.int64),
+        np.array(month, dtype=np.int64),
+        np.array(start, dtype="datetime64[D]"),
+        today, months,
+    )
+    spend = mask * np.array(cents, dtype=np.int64)[:, None]
+
+    codes, idx = np.unique(np.array(currency), return_inverse=True)
+    per_cur = np.zeros((len(codes), months), dtype=np.int64)
+    np.add.at(per_cur, idx, spend)
+
+    for code, row in zip(codes.tolist(), per_cur):
+        if code in out:
+            out[code] += row
+        else:
+            out[code] = row
+
+
+async def user_forecast(user_id: int, today: date, months: int) -> Dict[str, np.ndarray]:
+    async with get_engine().connect() as conn:
+        rows = (await conn.execute(USER_SQL, {"user_id": user_id, "today": today})).all()
+    out: Dict[str, np.ndarray] = {}
+    aggregate(rows, today, months, out)
+    return out
+
+
+async def fleet_forecast(today: date, months: int, chunk: int = CHUNK_ROWS) -> Dict[str, np.ndarray]:
+    # для отчётов: дата «сегодня» общая (UTC), пачками через серверный курсор
+    out: Dict[str, np.ndarray] = {}
+    async with get_engine().connect() as conn:
+        result = await conn.stream(FLEET_SQL.execution_options(yield_per=chunk), {"today": today})
+        async for rows in result.partitions(chunk):
+            aggregate(rows, today, months, out)
+    return out
+
+
+def format_table(starts: Iterable[date], totals: Dict[str, np.ndarray]) -> list[str]:
+    starts = list(starts)
+    lines = []
+    for cur in sorted(totals):
+        lines.append(f"{cur}: всего {totals[cur].sum() / 100:.2f}")
+        for d, v in zip(starts, totals[cur]):
+            lines.append(f"  {d:%m.%Y}: {v / 100:.2f}")
+    return lines
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Прогноз списаний по всем пользователям")
+    parser.add_argument("--months", type=int, default=12)
+    args = parser.parse_args()
+
+    init_db("cli")
+    today = utc_now().date()
+    totals = await fleet_forecast(today, args.months)
+    print("\n".join(format_table(month_starts(today, args.months), totals)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import csv
+import os
+import time
+from decimal import Decimal
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from app.config import load_config
+from app.db import get_engine
+
+cfg = load_config()
+
+# Курсы: сколько стоит 1 единица валюты в базовой валюте (cfg.fx_base).
+# Источник — файл FX_RATES_FILE (CSV: currency,rate) или таблица fx_rates.
+_rates: Dict[str, Decimal] = {}
+_version: Optional[tuple] = None
+_checked_at = 0.0
+
+
+def _file_version(path: str) -> tuple:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_file(path: str) -> Dict[str, Decimal]:
+    rates: Dict[str, Decimal] = {}
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].strip().lower() == "currency":
+                continue
+            rates[row[0].strip().upper()] = Decimal(row[1].strip())
+    return rates
+
+
+async def get_rates() -> Dict[str, Decimal]:
+    """Таблица курсов из памяти. Раз в TTL проверяем версию источника и перечитываем, только если она сменилась."""
+    global _rates, _version, _checked_at
+    if _version is not None and time.monotonic() - _checked_at < cfg.fx_ttl_seconds:
+        return _rates
+
+    if cfg.fx_rates_file:
+        version = _file_version(cfg.fx_rates_file)
+        if version != _version:
+            _rates = _read_file(cfg.fx_rates_file)
+    else:
+        async with get_engine().connect() as conn:
+            version = tuple((await conn.execute(
+                text("SELECT max(updated_at), count(*) FROM fx_rates")
+            )).one())
+            if version != _version:
+                rows = (await conn.execute(text("SELECT currency, rate FROM fx_rates"))).all()
+                _rates = {cur.upper(): Decimal(rate) for cur, rate in rows}
+
+    _rates.setdefault(cfg.fx_base, Decimal("1"))
+    _version = version
+    _checked_at = time.monotonic()
+    return _rates
+
+
+def convert_totals(
+    totals: Dict[str, Decimal], target: str, rates: Dict[str, Decimal]
+) -> tuple[Optional[Decimal], list[str]]:
+    """Сводит суммы по валютам в одну. Возвращает (сумма или None, валюты без курса)."""
+    if target not in rates:
+        return None, [target]
+
+    missing = [cur for cur in totals if cur not in rates]
+    total = sum(
+        (amount * rates[cur] for cur, amount in totals.items() if cur in rates),
+        Decimal("0"),
+    )
+    return total / rates[target], missing
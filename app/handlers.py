@@ -1,10 +1,11 @@
-﻿import uuid
-from decimal import Decimal, InvalidOperation
-from datetime import datetime
-from zoneinfo import ZoneInfo
+﻿import logging
+import uuid
+from decimal import Decimal
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from aiogram import Dispatcher, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
@@ -12,21 +13,45 @@ from aiogram.filters import Command
 
 from sqlalchemy import select, update
 
-from app.analytics import track_event
+from app import ics
+from app.analytics import add_event
+from app.querytrace import query_budget
+from app import profiling
+from app.broadcast import create_broadcast, cancel_broadcasts, latest_broadcast
+from app.fx import get_rates, convert_totals
+from app.forecast import user_forecast, month_starts, format_table
+from app.reschedule import reschedule_pending
+from app.stats import load_stats
+from app.search import INLINE_LIMIT, SearchTimeout, search_subscriptions
+from app.importer import parse_import, decode_upload, FORMAT_HELP as IMPORT_FORMAT_HELP
+from app.validators import parse_amount, parse_currency, parse_day, parse_month
 from app.config import load_config
 from app.db import SessionLocal
 from app.models import User, Subscription, Reminder
 from app.keyboards import (
     main_menu_kb, currency_kb, period_kb, confirm_kb,
-    list_actions_kb, sub_card_kb, how_cancel_kb
+    list_actions_kb, manage_kb, sub_card_kb, how_cancel_kb, search_results_kb
 )
 from app.dates import (
     calc_next_charge_date_monthly, calc_next_charge_date_yearly,
-    local_remind_at_days, to_utc, utc_now
+    utc_now, now_in, plan_reminders, iter_charge_dates
 )
-from app.texts import APPLE_STEPS, GOOGLE_STEPS, WEB_STEPS, UNKNOWN_STEPS
+from app.render import PERIOD_LABELS, confirm_text, subscription_card, subscription_list
+from app.texts import fmt_date, APPLE_STEPS, GOOGLE_STEPS, WEB_STEPS, UNKNOWN_STEPS
 
 cfg = load_config()
+logger = logging.getLogger(__name__)
+
+UPCOMING_DEFAULT_DAYS = 30
+UPCOMING_MAX_DAYS = 90
+FORECAST_DEFAULT_MONTHS = 12
+FORECAST_MAX_MONTHS = 36
+IMPORT_MAX_FILE_BYTES = 256 * 1024
+IMPORT_MAX_ERRORS_SHOWN = 20
+
+
+class ImportSubs(StatesGroup):
+    waiting = State()
 
 
 class AddSub(StatesGroup):
@@ -41,8 +66,16 @@ class AddSub(StatesGroup):
     confirm = State()
 
 
-def _period_label(p: str) -> str:
-    return "ежемесячно" if p == "monthly" else "раз в год"
+def user_subscriptions_stmt(user_id: int):
+    # список пользователя для /list и «Управлять подписками»
+    return select(Subscription).where(
+        Subscription.user_id == user_id,
+        Subscription.deleted_at.is_(None),
+    ).order_by(Subscription.created_at.asc())
+
+
+def new_user(user_id: int) -> User:
+    return User(user_id=user_id, timezone=cfg.default_tz, default_currency=None)
 
 
 async def ensure_user(user_id: int) -> tuple[User, bool]:
@@ -51,15 +84,22 @@ async def ensure_user(user_id: int) -> tuple[User, bool]:
         if u:
             return u, False
 
-        u = User(user_id=user_id, timezone=cfg.default_tz, default_currency=None)
+        u = new_user(user_id)
         s.add(u)
         await s.commit()
         return u, True
 
 
+@query_budget(3)
 async def start_menu(message: Message):
-    _, created = await ensure_user(message.from_user.id)
-    await track_event(message.from_user.id, "user_started", {"first": created})
+    user_id = message.from_user.id
+    async with SessionLocal() as s:
+        created = await s.get(User, user_id) is None
+        if created:
+            s.add(new_user(user_id))
+        # новый пользователь и событие — одним commit
+        await add_event(s, user_id, "user_started", {"first": created})
+        await s.commit()
     await message.answer("Выбери действие:", reply_markup=main_menu_kb())
 
 
@@ -75,129 +115,329 @@ async def cmd_add(message: Message, state: FSMContext):
     await state.set_state(AddSub.name)
     await message.answer("Как называется сервис? (например: Netflix, iCloud, VPN)")
 
+async def _fx_total_line(totals: dict[str, dict[str, Decimal]], default_currency: str | None) -> str | None:
+    # одна сумма «в год» в валюте пользователя по локальной таблице курсов
+    target = default_currency or cfg.fx_base
+    if not totals or (len(totals) == 1 and target in totals):
+        return None
+
+    yearly = {cur: t["monthly"] * Decimal("12") + t["yearly"] for cur, t in totals.items()}
+    # строка необязательная: без курсов /list всё равно должен открыться
+    try:
+        rates = await get_rates()
+    except Exception:
+        logger.warning("FX rates unavailable, /list without the converted total", exc_info=True)
+        return None
+    total, missing = convert_totals(yearly, target, rates)
+    if total is None:
+        return None
+
+    line = f"\n**Всего в {target}:** ≈ {total / Decimal('12'):.2f}/мес, {total:.2f}/год"
+    if missing:
+        line += f" (без {', '.join(missing)}: нет курса)"
+    return line
+
+
+async def cmd_currency(message: Message):
+    # /currency EUR — валюта для общей суммы в /list
+    parts = (message.text or "").split(maxsplit=1)
+    u, _ = await ensure_user(message.from_user.id)
+    if len(parts) < 2:
+        await message.answer(
+            f"Валюта для общей суммы: {u.default_currency or cfg.fx_base}\n"
+            "Чтобы сменить, напиши например: /currency USD"
+        )
+        return
+
+    cur = parts[1].strip().upper()[:8]
+    if not cur.isalpha():
+        await message.answer("Введи код валюты буквами, например: USD")
+        return
+
+    async with SessionLocal() as s:
+        await s.execute(update(User).where(User.user_id == u.user_id).values(default_currency=cur))
+        await s.commit()
+
+    await message.answer(f"Готово: общая сумма в /list будет в {cur}.")
+
+
+@query_budget(5)
 async def cmd_list(message: Message):
     # то же, что cb_menu_list, только для /list
     user_id = message.from_user.id
 
+    async with SessionLocal() as s:
+        u = await s.get(User, user_id)
+        subs = (await s.execute(user_subscriptions_stmt(user_id))).scalars().all()
+
+    if not subs:
+        await message.answer("Пока нет подписок. Добавим первую?", reply_markup=main_menu_kb())
+        return
+
+    msg, totals = subscription_list(subs)
+    fx_line = await _fx_total_line(totals, u.default_currency if u else None)
+    if fx_line:
+        msg.append(fx_line)
+
+    await message.answer("\n".join(msg), reply_markup=list_actions_kb(), parse_mode="Markdown")
+
+async def upcoming_text(user_id: int, days: int) -> str:
+    u, _ = await ensure_user(user_id)
+    today = now_in(u.timezone).date()
+    until = today + timedelta(days=days)
+
+    # индекс (user_id, next_charge_date): читаем только то, что спишется в окне
     async with SessionLocal() as s:
         subs = (await s.execute(
             select(Subscription).where(
                 Subscription.user_id == user_id,
                 Subscription.deleted_at.is_(None),
-            ).order_by(Subscription.created_at.asc())
+                Subscription.next_charge_date <= until,
+            ).order_by(Subscription.next_charge_date.asc())
         )).scalars().all()
 
-    if not subs:
-        await message.answer("Пока нет подписок. Добавим первую?", reply_markup=main_menu_kb())
-        return
-
-    totals: dict[str, dict[str, Decimal]] = {}
-    lines = []
-    active_count = 0
+    charges = []
+    for sub in subs:
+        start = max(sub.next_charge_date, today)
+        for d in iter_charge_dates(
+            sub.billing_period, sub.charge_day, sub.charge_month, sub.charge_dom, start, until
+        ):
+            charges.append((d, sub))
+
+    if not charges:
+        return f"В ближайшие {days} дн. списаний нет."
+
+    charges.sort(key=lambda x: x[0])
+    totals: dict[str, Decimal] = {}
+    lines = [f"Списания в ближайшие {days} дн.:"]
+    for d, sub in charges:
+        lines.append(f"{fmt_date(d)} — {sub.name} — {sub.amount} {sub.currency}")
+        totals[sub.currency] = totals.get(sub.currency, Decimal("0")) + Decimal(str(sub.amount))
+
+    lines.append("")
+    lines.append("Итого: " + ", ".join(f"{v:.2f} {cur}" for cur, v in totals.items()))
+    return "\n".join(lines)
+
+
+@query_budget(3)
+async def cmd_upcoming(message: Message):
+    # /upcoming или /upcoming 7
+    parts = (message.text or "").split(maxsplit=1)
+    days = UPCOMING_DEFAULT_DAYS
+    if len(parts) > 1:
+        try:
+            days = int(parts[1].strip())
+            if days < 1:
+                raise ValueError
+        except ValueError:
+            await message.answer("Укажи число дней, например: /upcoming 7")
+            return
+    days = min(days, UPCOMING_MAX_DAYS)
 
-    for i, sub in enumerate(subs, 1):
-        status = " (выкл. напоминания)" if not sub.is_active else ""
-        if sub.is_active:
-            active_count += 1
+    await message.answer(await upcoming_text(message.from_user.id, days), reply_markup=main_menu_kb())
 
-        if sub.billing_period == "monthly":
-            date_info = f"{sub.charge_day}"
-            per = "мес"
-        else:
-            date_info = f"{sub.charge_dom:02d}.{sub.charge_month:02d}"
-            per = "год"
 
-        lines.append(f"{i}) {sub.name} — {sub.amount} {sub.currency} / {per} ({date_info}){status}")
+@query_budget(3)
+async def cb_menu_upcoming(cb: CallbackQuery):
+    await cb.answer()
+    await cb.message.answer(
+        await upcoming_text(cb.from_user.id, UPCOMING_DEFAULT_DAYS), reply_markup=main_menu_kb()
+    )
 
-        cur = sub.currency
-        totals.setdefault(cur, {"monthly": Decimal("0"), "yearly": Decimal("0")})
 
-        if sub.is_active:
-            if sub.billing_period == "monthly":
-                totals[cur]["monthly"] += Decimal(str(sub.amount))
-            else:
-                totals[cur]["yearly"] += Decimal(str(sub.amount))
+@query_budget(3)
+async def cmd_forecast(message: Message):
+    # /forecast или /forecast 24 — прогноз по месяцам, по валютам (только активные)
+    parts = (message.text or "").split(maxsplit=1)
+    months = FORECAST_DEFAULT_MONTHS
+    if len(parts) > 1:
+        try:
+            months = int(parts[1].strip())
+            if months < 1:
+                raise ValueError
+        except ValueError:
+            await message.answer("Укажи число месяцев, например: /forecast 24")
+            return
+    months = min(months, FORECAST_MAX_MONTHS)
 
-    msg = [f"**Активные подписки ({active_count}):**"]
-    msg.extend(lines)
-    msg.append("\n**Итого (по валютам):**")
+    u, _ = await ensure_user(message.from_user.id)
+    today = now_in(u.timezone).date()
+    totals = await user_forecast(u.user_id, today, months)
+    if not totals:
+        await message.answer("Пока нет активных подписок.", reply_markup=main_menu_kb())
+        return
 
-    for cur, t in totals.items():
-        monthly = t["monthly"]
-        yearly = t["yearly"]
-        yearly_equiv = (yearly / Decimal("12")) if yearly != 0 else Decimal("0")
-        grand_year = monthly * Decimal("12") + yearly
-        msg.append(f"- {cur}: {monthly:.2f}/мес + {yearly:.2f}/год (≈ {yearly_equiv:.2f}/мес), в год: {grand_year:.2f}")
+    msg = [f"Прогноз списаний на {months} мес.:"]
+    msg.extend(format_table(month_starts(today, months), totals))
+    await message.answer("\n".join(msg))
 
-    await message.answer("\n".join(msg), reply_markup=list_actions_kb(), parse_mode="Markdown")
 
 async def cmd_help(message: Message):
     await message.answer(
         "Команды:\n"
         "/start — меню\n"
         "/add — добавить подписку\n"
-        "/list — мои подписки\n\n"
+        "/import — добавить сразу список\n"
+        "/list — мои подписки\n"
+        "/find — найти подписку по названию\n"
+        "/upcoming — ближайшие списания\n"
+        "/forecast — прогноз трат по месяцам\n"
+        "/currency — валюта для общей суммы\n"
+        "/calendar — календарь списаний\n"
+        "/tz — часовой пояс для напоминаний\n\n"
         "Если кнопки не работают — напиши /start."
     )
 
 
+async def cmd_calendar(message: Message):
+    url = ics.feed_url(message.from_user.id)
+    if not url:
+        await message.answer("Календарь пока недоступен: бот запущен без веб-сервера.")
+        return
+
+    await message.answer(
+        "Ссылка на календарь списаний (добавь её в Google/Apple Calendar как подписку):\n"
+        f"{url}\n\n"
+        "Ссылка личная — не публикуй её."
+    )
+
+
+async def cmd_tz(message: Message):
+    # /tz — показать пояс, /tz Europe/Berlin — сменить
+    u, _ = await ensure_user(message.from_user.id)
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer(
+            f"Твой часовой пояс: {u.timezone}\n"
+            "Чтобы сменить, напиши например: /tz Europe/Berlin"
+        )
+        return
+
+    tz = parts[1].strip()
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        await message.answer("Не знаю такой пояс. Пример: /tz Europe/Berlin")
+        return
+
+    async with SessionLocal() as s:
+        await s.execute(update(User).where(User.user_id == u.user_id).values(timezone=tz))
+        await add_event(s, u.user_id, "timezone_changed", {"from": u.timezone, "to": tz})
+        await s.commit()
+
+    moved = await reschedule_pending(u.user_id)
+    await message.answer(f"Готово: {tz}. Перенесено напоминаний: {moved}.")
+
+
+async def cmd_stats(message: Message):
+    # только для админов из ADMIN_IDS; остальным команда как будто не существует
+    if message.from_user.id not in cfg.admin_ids:
+        return
+
+    st = await load_stats()
+    today = st["today"]
+    days = st["days"]
+
+    dau_avg = sum(d.get("dau", 0) for d in days.values()) / max(len(days), 1)
+    added_week = sum(d.get("subs_added", 0) for d in days.values())
+
+    msg = [
+        "📊 Статистика (UTC)",
+        f"Сегодня: DAU {today.get('dau', 0)}, новых подписок {today.get('subs_added', 0)}",
+        f"За 7 дней: DAU в среднем {dau_avg:.1f}, подписок добавлено {added_week}",
+        "",
+        "Напоминания за 7 дней:",
+    ]
+
+    for kind in sorted(st["reminders"]):
+        r = st["reminders"][kind]
+        ratio = (r["acked"] / r["sent"] * 100) if r["sent"] else 0.0
+        msg.append(
+            f"- {kind}: отправлено {r['sent']}, подтверждено {r['acked']} ({ratio:.0f}%), ошибок {r['failed']}"
+        )
+    if not st["reminders"]:
+        msg.append("- нет данных")
+
+    lag_min = int(st["lag"].total_seconds() // 60)
+    msg.append("")
+    msg.append(f"Очередь: {st['backlog']} к отправке, отставание {lag_min} мин")
+    msg.append(f"Снимок: {st['generated_at']:%H:%M:%S}")
+
+    await message.answer("\n".join(msg))
+
+
+async def cmd_profile(message: Message):
+    # /profile on [доля] [порог_мс] | off — включает профилирование медленных апдейтов на лету
+    if message.from_user.id not in cfg.admin_ids:
+        return
+
+    st = profiling.settings
+    args = (message.text or "").split()[1:]
+    try:
+        if args and args[0] == "on":
+            st.enabled = True
+            if len(args) > 1:
+                st.sample_rate = min(max(float(args[1]), 0.0), 1.0)
+            if len(args) > 2:
+                st.slow_ms = max(int(args[2]), 0)
+        elif args and args[0] == "off":
+            st.enabled = False
+    except ValueError:
+        await message.answer("Формат: /profile on [доля 0..1] [порог мс] | off")
+        return
+
+    await message.answer(
+        f"Профилирование: {'вкл' if st.enabled else 'выкл'}, "
+        f"доля {st.sample_rate:g}, порог {st.slow_ms} мс, папка {st.out_dir}"
+    )
+
+
+async def cmd_broadcast(message: Message):
+    # /broadcast <текст> — рассылка всем; /broadcast — статус; /broadcast cancel — остановить
+    if message.from_user.id not in cfg.admin_ids:
+        return
+
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        b = await latest_broadcast()
+        if not b:
+            await message.answer("Рассылок ещё не было.")
+            return
+        await message.answer(
+            f"Рассылка #{b.id}: {b.status}\n"
+            f"Отправлено: {b.sent_count}, ошибок: {b.failed_count}, курсор: {b.cursor_user_id}"
+        )
+        return
+
+    arg = parts[1].strip()
+    if arg.lower() == "cancel":
+        n = await cancel_broadcasts()
+        await message.answer(f"Остановлено рассылок: {n}.")
+        return
+
+    bid = await create_broadcast(arg, message.from_user.id)
+    await message.answer(f"Рассылка #{bid} поставлена в очередь. Статус: /broadcast")
+
+
+@query_budget(6)
 async def cb_menu_list(cb: CallbackQuery):
     await cb.answer()
     user_id = cb.from_user.id
 
     async with SessionLocal() as s:
-        subs = (await s.execute(
-            select(Subscription).where(
-                Subscription.user_id == user_id,
-                Subscription.deleted_at.is_(None),
-            ).order_by(Subscription.created_at.asc())
-        )).scalars().all()
-
-    await track_event(user_id, "subscriptions_viewed", {"count": len(subs)})
+        u = await s.get(User, user_id)
+        subs = (await s.execute(user_subscriptions_stmt(user_id))).scalars().all()
+        await add_event(s, user_id, "subscriptions_viewed", {"count": len(subs)})
+        await s.commit()
 
     if not subs:
         await cb.message.answer("Пока нет подписок. Добавим первую?", reply_markup=main_menu_kb())
         return
 
-    totals: dict[str, dict[str, Decimal]] = {}
-    lines = []
-    active_count = 0
-
-    for i, sub in enumerate(subs, 1):
-        status = " (выкл. напоминания)" if not sub.is_active else ""
-        if sub.is_active:
-            active_count += 1
-
-        if sub.billing_period == "monthly":
-            date_info = f"{sub.charge_day}"
-            per = "мес"
-        else:
-            date_info = f"{sub.charge_dom:02d}.{sub.charge_month:02d}"
-            per = "год"
-
-        lines.append(f"{i}) {sub.name} — {sub.amount} {sub.currency} / {per} ({date_info}){status}")
-
-        cur = sub.currency
-        totals.setdefault(cur, {"monthly": Decimal("0"), "yearly": Decimal("0")})
-
-        if sub.is_active:
-            if sub.billing_period == "monthly":
-                totals[cur]["monthly"] += Decimal(str(sub.amount))
-            else:
-                totals[cur]["yearly"] += Decimal(str(sub.amount))
-
-    msg = [f"**Активные подписки ({active_count}):**"]
-    msg.extend(lines)
-    msg.append("\n**Итого (по валютам):**")
-
-    for cur, t in totals.items():
-        monthly = t["monthly"]
-        yearly = t["yearly"]
-        yearly_equiv = (yearly / Decimal("12")) if yearly != 0 else Decimal("0")
-        grand_year = monthly * Decimal("12") + yearly
-        msg.append(
-            f"- {cur}: {monthly:.2f}/мес + {yearly:.2f}/год (≈ {yearly_equiv:.2f}/мес), в год: {grand_year:.2f}"
-        )
+    msg, totals = subscription_list(subs)
+    fx_line = await _fx_total_line(totals, u.default_currency if u else None)
+    if fx_line:
+        msg.append(fx_line)
 
     await cb.message.answer("\n".join(msg), reply_markup=list_actions_kb(), parse_mode="Markdown")
 
@@ -209,16 +449,12 @@ async def add_name(message: Message, state: FSMContext):
 
 
 async def add_amount(message: Message, state: FSMContext):
-    raw = message.text.strip().replace(",", ".")
-    try:
-        amount = Decimal(raw)
-        if amount <= 0:
-            raise InvalidOperation
-    except Exception:
+    amount = parse_amount(message.text)
+    if amount is None:
         await message.answer("Не похоже на сумму. Введи число, например: 9.99")
         return
 
-    await state.update_data(amount=str(amount.quantize(Decimal("0.01"))))
+    await state.update_data(amount=str(amount))
     await state.set_state(AddSub.currency)
     await message.answer("В какой валюте?", reply_markup=currency_kb())
 
@@ -237,8 +473,8 @@ async def cb_currency(cb: CallbackQuery, state: FSMContext):
 
 
 async def add_currency_other(message: Message, state: FSMContext):
-    cur = message.text.strip().upper()[:8]
-    if not cur.isalpha():
+    cur = parse_currency(message.text)
+    if cur is None:
         await message.answer("Введи код валюты буквами, например: GBP")
         return
 
@@ -261,11 +497,8 @@ async def cb_period(cb: CallbackQuery, state: FSMContext):
 
 
 async def add_monthly_day(message: Message, state: FSMContext):
-    try:
-        d = int(message.text.strip())
-        if d < 1 or d > 31:
-            raise ValueError
-    except Exception:
+    d = parse_day(message.text)
+    if d is None:
         await message.answer("Введи число от 1 до 31.")
         return
 
@@ -275,11 +508,8 @@ async def add_monthly_day(message: Message, state: FSMContext):
 
 
 async def add_yearly_month(message: Message, state: FSMContext):
-    try:
-        m = int(message.text.strip())
-        if m < 1 or m > 12:
-            raise ValueError
-    except Exception:
+    m = parse_month(message.text)
+    if m is None:
         await message.answer("Введи месяц числом 1–12.")
         return
 
@@ -289,11 +519,8 @@ async def add_yearly_month(message: Message, state: FSMContext):
 
 
 async def add_yearly_day(message: Message, state: FSMContext):
-    try:
-        d = int(message.text.strip())
-        if d < 1 or d > 31:
-            raise ValueError
-    except Exception:
+    d = parse_day(message.text)
+    if d is None:
         await message.answer("Введи число от 1 до 31.")
         return
 
@@ -304,23 +531,41 @@ async def add_yearly_day(message: Message, state: FSMContext):
 
 async def show_confirm(message: Message, state: FSMContext):
     data = await state.get_data()
-    name = data["name"]
-    amount = data["amount"]
-    currency = data["currency"]
-    per = data["period"]
+    await message.answer(confirm_text(data), reply_markup=confirm_kb(), parse_mode="Markdown")
+
 
+def build_subscription(user_id: int, data: dict, now_local: datetime) -> Subscription:
+    # data — поля в формате AddSub (их же отдаёт parse_import)
+    per = data["period"]
     if per == "monthly":
-        date_info = f"{data['charge_day']} числа"
+        next_charge = calc_next_charge_date_monthly(now_local, data["charge_day"])
+        billing_period = "monthly"
+        charge_day = data["charge_day"]
+        charge_month = None
+        charge_dom = None
     else:
-        date_info = f"{data['charge_dom']:02d}.{data['charge_month']:02d}"
+        next_charge = calc_next_charge_date_yearly(now_local, data["charge_month"], data["charge_dom"])
+        billing_period = "yearly"
+        charge_day = None
+        charge_month = data["charge_month"]
+        charge_dom = data["charge_dom"]
 
-    text = (
-        "Проверь:\n"
-        f"**{name} — {amount} {currency} — {_period_label(per)} — дата: {date_info}**"
+    return Subscription(
+        user_id=user_id,
+        name=data["name"],
+        amount=data["amount"],
+        currency=data["currency"],
+        billing_period=billing_period,
+        charge_day=charge_day,
+        charge_month=charge_month,
+        charge_dom=charge_dom,
+        next_charge_date=next_charge,
+        is_active=True,
+        deleted_at=None,
     )
-    await message.answer(text, reply_markup=confirm_kb(), parse_mode="Markdown")
 
 
+@query_budget(6)
 async def cb_confirm(cb: CallbackQuery, state: FSMContext):
     await cb.answer()
     action = cb.data.split(":")[-1]
@@ -343,52 +588,84 @@ async def cb_confirm(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data()
 
     tz = u.timezone
-    now_local = datetime.now(ZoneInfo(tz))
-
-    per = data["period"]
-    if per == "monthly":
-        next_charge = calc_next_charge_date_monthly(now_local, data["charge_day"])
-        billing_period = "monthly"
-        charge_day = data["charge_day"]
-        charge_month = None
-        charge_dom = None
-    else:
-        next_charge = calc_next_charge_date_yearly(now_local, data["charge_month"], data["charge_dom"])
-        billing_period = "yearly"
-        charge_day = None
-        charge_month = data["charge_month"]
-        charge_dom = data["charge_dom"]
-
-    sub = Subscription(
-        user_id=user_id,
-        name=data["name"],
-        amount=data["amount"],
-        currency=data["currency"],
-        billing_period=billing_period,
-        charge_day=charge_day,
-        charge_month=charge_month,
-        charge_dom=charge_dom,
-        next_charge_date=next_charge,
-        is_active=True,
-        deleted_at=None,
-    )
+    now_local = now_in(tz)
+    sub = build_subscription(user_id, data, now_local)
 
     async with SessionLocal() as s:
         s.add(sub)
         await s.flush()
-        await create_reminders(s, sub, tz, next_charge)
+        await create_reminders(s, sub, tz, sub.next_charge_date)
+        await add_event(s, user_id, "subscription_added", {
+            "period": sub.billing_period,
+            "currency": data["currency"],
+            "amount": str(data["amount"]),
+        })
         await s.commit()
-
-    await track_event(user_id, "subscription_added", {
-        "period": billing_period,
-        "currency": data["currency"],
-        "amount": str(data["amount"]),
-    })
+    ics.invalidate(user_id)
 
     await state.clear()
     await cb.message.answer("Сохранено ✅", reply_markup=main_menu_kb())
 
 
+async def cmd_import(message: Message, state: FSMContext):
+    # /import сразу с текстом или /import, а затем текст/файл следующим сообщением
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) > 1:
+        await state.clear()
+        await import_subscriptions(message, parts[1])
+        return
+
+    await state.clear()
+    await state.set_state(ImportSubs.waiting)
+    await message.answer("Пришли список текстом или файлом (CSV/TXT).\n\n" + IMPORT_FORMAT_HELP)
+
+
+async def import_receive(message: Message, state: FSMContext):
+    if message.document:
+        if (message.document.file_size or 0) > IMPORT_MAX_FILE_BYTES:
+            await message.answer("Файл слишком большой (максимум 256 КБ).")
+            return
+        doc = await message.bot.download(message.document)
+        text = decode_upload(doc)
+    elif message.text:
+        text = message.text
+    else:
+        await message.answer("Пришли список текстом или файлом.")
+        return
+
+    await state.clear()
+    await import_subscriptions(message, text)
+
+
+async def import_subscriptions(message: Message, text: str):
+    items, errors = parse_import(text)
+    u, _ = await ensure_user(message.from_user.id)
+    now_local = now_in(u.timezone)
+
+    if items:
+        subs = [build_subscription(u.user_id, data, now_local) for data in items]
+        # одна транзакция на весь импорт: один INSERT подписок пачкой, затем их напоминания
+        async with SessionLocal() as s:
+            s.add_all(subs)
+            await s.flush()
+            for sub in subs:
+                await create_reminders(s, sub, u.timezone, sub.next_charge_date)
+            await add_event(s, u.user_id, "subscriptions_imported", {"count": len(items), "errors": len(errors)})
+            await s.commit()
+        ics.invalidate(u.user_id)
+
+    msg = [f"Импортировано: {len(items)}."]
+    if errors:
+        msg.append(f"Ошибки ({len(errors)}):")
+        msg.extend(errors[:IMPORT_MAX_ERRORS_SHOWN])
+        if len(errors) > IMPORT_MAX_ERRORS_SHOWN:
+            msg.append(f"…и ещё {len(errors) - IMPORT_MAX_ERRORS_SHOWN}")
+    if not items and not errors:
+        msg = ["Не нашёл ни одной строки.\n\n" + IMPORT_FORMAT_HELP]
+
+    await message.answer("\n".join(msg), reply_markup=main_menu_kb())
+
+
 async def create_reminders(session, sub: Subscription, tz: str, charge_date):
     now_utc = utc_now()
 
@@ -408,12 +685,7 @@ async def create_reminders(session, sub: Subscription, tz: str, charge_date):
         return
 
     # Обычный режим: D-3 и D-1 (в днях)
-    for kind, days_before in [("D3", 3), ("D1", 1)]:
-        local_dt = local_remind_at_days(charge_date, days_before, cfg.reminder_hour, tz)
-        remind_utc = to_utc(local_dt)
-        if remind_utc <= now_utc:
-            continue
-
+    for kind, remind_utc in plan_reminders(charge_date, tz, cfg.reminder_hour, now_utc):
         session.add(Reminder(
             subscription_id=sub.id,
             kind=kind,
@@ -424,32 +696,64 @@ async def create_reminders(session, sub: Subscription, tz: str, charge_date):
         ))
 
 
+@query_budget(2)
+async def cmd_find(message: Message):
+    # /find netfl — опечатки и часть названия тоже находятся
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2 or not parts[1].strip():
+        await message.answer("Напиши, что искать, например: /find netflix")
+        return
+
+    query = parts[1].strip()
+    try:
+        results = await search_subscriptions(message.from_user.id, query)
+    except SearchTimeout:
+        await message.answer("Поиск не успел, попробуй уточнить запрос.")
+        return
+
+    if not results:
+        await message.answer(f"Ничего похожего на «{query}» не нашлось. Весь список — /list")
+        return
+    await message.answer("Нашлось:", reply_markup=search_results_kb(results))
+
+
+@query_budget(2)
+async def inline_find(query: InlineQuery):
+    # @бот netfl в любом чате; пустой запрос — ближайшие списания
+    try:
+        results = await search_subscriptions(query.from_user.id, query.query, INLINE_LIMIT)
+    except SearchTimeout:
+        results = []
+
+    articles = []
+    for r in results:
+        price = f"{r.amount} {r.currency}, {PERIOD_LABELS[r.billing_period]}"
+        articles.append(InlineQueryResultArticle(
+            id=str(r.id),
+            title=r.name,
+            description=price if r.is_active else f"{price} (выкл. напоминания)",
+            input_message_content=InputTextMessageContent(message_text=f"{r.name} — {price}"),
+        ))
+    # результаты личные: кэш Telegram не должен отдавать их другим
+    await query.answer(articles, cache_time=5, is_personal=True)
+
+
+@query_budget(1)
 async def cb_manage(cb: CallbackQuery):
     await cb.answer()
     user_id = cb.from_user.id
 
     async with SessionLocal() as s:
-        subs = (await s.execute(
-            select(Subscription).where(
-                Subscription.user_id == user_id,
-                Subscription.deleted_at.is_(None),
-            ).order_by(Subscription.created_at.asc())
-        )).scalars().all()
+        subs = (await s.execute(user_subscriptions_stmt(user_id))).scalars().all()
 
     if not subs:
         await cb.message.answer("Список пуст.", reply_markup=main_menu_kb())
         return
 
-    from aiogram.utils.keyboard import InlineKeyboardBuilder
-    kb = InlineKeyboardBuilder()
-    for sub in subs[:40]:  # MVP лимит
-        kb.button(text=sub.name, callback_data=f"sub:open:{sub.id}")
-    kb.button(text="↩️ Назад", callback_data="menu:list")
-    kb.adjust(1)
-
-    await cb.message.answer("Выбери подписку:", reply_markup=kb.as_markup())
+    await cb.message.answer("Выбери подписку:", reply_markup=manage_kb(subs))
 
 
+@query_budget(1)
 async def cb_sub_open(cb: CallbackQuery):
     await cb.answer()
     sub_id = cb.data.split(":")[-1]
@@ -460,25 +764,10 @@ async def cb_sub_open(cb: CallbackQuery):
             await cb.message.answer("Подписка не найдена.")
             return
 
-    if sub.billing_period == "monthly":
-        date_info = f"{sub.charge_day} числа"
-        per = "ежемесячно"
-    else:
-        date_info = f"{sub.charge_dom:02d}.{sub.charge_month:02d}"
-        per = "раз в год"
-
-    status = "Активна" if sub.is_active else "Напоминания выключены"
-
-    text = (
-        f"**{sub.name}**\n"
-        f"Цена: {sub.amount} {sub.currency}\n"
-        f"Период: {per}\n"
-        f"Дата списания: {date_info}\n"
-        f"Статус: {status}"
-    )
-    await cb.message.answer(text, reply_markup=sub_card_kb(str(sub.id)), parse_mode="Markdown")
+    await cb.message.answer(subscription_card(sub), reply_markup=sub_card_kb(str(sub.id)), parse_mode="Markdown")
 
 
+@query_budget(3)
 async def cb_sub_disable(cb: CallbackQuery):
     await cb.answer()
     sub_id = cb.data.split(":")[-1]
@@ -500,6 +789,7 @@ async def cb_sub_disable(cb: CallbackQuery):
     await cb.message.answer("Ок. Напоминания для этой подписки отключены в боте.")
 
 
+@query_budget(3)
 async def cb_sub_delete(cb: CallbackQuery):
     await cb.answer()
     sub_id = cb.data.split(":")[-1]
@@ -510,13 +800,14 @@ async def cb_sub_delete(cb: CallbackQuery):
             await cb.message.answer("Подписка не найдена.")
             return
 
-        sub.deleted_at = datetime.utcnow()
+        sub.deleted_at = utc_now()
         await s.execute(
             update(Reminder)
             .where(Reminder.subscription_id == sub.id, Reminder.status == "pending")
             .values(status="canceled")
         )
         await s.commit()
+    ics.invalidate(cb.from_user.id)
 
     await cb.message.answer("Удалено из списка.")
 
@@ -541,48 +832,68 @@ async def cb_cancel_steps(cb: CallbackQuery):
     await cb.message.answer(txt)
 
 
+async def ack_reminder(s, rid_u: uuid.UUID, kind: str, now: datetime) -> bool:
+    # без commit: вызывающий решает, фиксировать ли (бенчмарк откатывает)
+    r = await s.get(Reminder, rid_u)
+    if not r:
+        return False
+
+    if r.acked_at is None:
+        r.acked_at = now
+
+    # Вариант B: ack D3 -> cancel pending D1 for same charge_date
+    if kind == "D3":
+        await s.execute(
+            update(Reminder)
+            .where(
+                Reminder.subscription_id == r.subscription_id,
+                Reminder.charge_date == r.charge_date,
+                Reminder.kind == "D1",
+                Reminder.status == "pending",
+            ).values(status="canceled")
+        )
+    return True
+
+
+@query_budget(4)
 async def cb_ok(cb: CallbackQuery):
     # ok:D3:<reminder_id> or ok:D1:<reminder_id>
     await cb.answer()
     _, kind, rid = cb.data.split(":")
     rid_u = uuid.UUID(rid)
-    now = datetime.utcnow()
+    now = utc_now()
 
     async with SessionLocal() as s:
-        r = await s.get(Reminder, rid_u)
-        if not r:
+        if not await ack_reminder(s, rid_u, kind, now):
             return
-
-        if r.acked_at is None:
-            r.acked_at = now
-
-        # Вариант B: ack D3 -> cancel pending D1 for same charge_date
-        if kind == "D3":
-            await s.execute(
-                update(Reminder)
-                .where(
-                    Reminder.subscription_id == r.subscription_id,
-                    Reminder.charge_date == r.charge_date,
-                    Reminder.kind == "D1",
-                    Reminder.status == "pending",
-                ).values(status="canceled")
-            )
-
+        await add_event(s, cb.from_user.id, "reminder_acked", {"kind": kind})
         await s.commit()
-
-    await track_event(cb.from_user.id, "reminder_acked", {"kind": kind})
     await cb.message.answer("Принято ✅")
 
 
 def setup(dp: Dispatcher):
     dp.message.register(start_menu, Command("start", "menu"))
     dp.message.register(cmd_add, Command("add"))
+    dp.message.register(cmd_import, Command("import"))
     dp.message.register(cmd_list, Command("list"))
+    dp.message.register(cmd_find, Command("find"))
+    dp.inline_query.register(inline_find)
+    dp.message.register(cmd_upcoming, Command("upcoming"))
+    dp.message.register(cmd_forecast, Command("forecast"))
     dp.message.register(cmd_help, Command("help"))
+    dp.message.register(cmd_currency, Command("currency"))
+    dp.message.register(cmd_calendar, Command("calendar"))
+    dp.message.register(cmd_tz, Command("tz"))
+    dp.message.register(cmd_stats, Command("stats"))
+    dp.message.register(cmd_broadcast, Command("broadcast"))
+    dp.message.register(cmd_profile, Command("profile"))
 
     dp.callback_query.register(cb_menu_add, F.data == "menu:add")
     dp.callback_query.register(cb_menu_list, F.data == "menu:list")
+    dp.callback_query.register(cb_menu_upcoming, F.data == "menu:upcoming")
+
 
+    dp.message.register(import_receive, ImportSubs.waiting)
 
     dp.message.register(add_name, AddSub.name)
     dp.message.register(add_amount, AddSub.amount)
@@ -0,0 +1,166 @@
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from aiohttp import web
+from sqlalchemy import func, select
+
+from app.config import load_config
+from app.db import SessionLocal
+from app.dates import iter_charge_dates, now_in
+from app.models import Subscription, User
+
+cfg = load_config()
+
+HORIZON_DAYS = 366
+MAX_CACHED = 10_000
+# сколько доверяем кэшу без проверки версии в БД (изменения из бота сбрасывают его сразу)
+VERSION_CHECK_SECONDS = 60
+ROUTE = "/ics/{user_id}/{token}.ics"
+
+# user_id -> (версия данных, время проверки, etag, тело)
+_cache: "OrderedDict[int, tuple[tuple, float, str, bytes]]" = OrderedDict()
+
+
+def feed_token(user_id: int) -> str:
+    return hmac.new(cfg.ics_secret.encode(), str(user_id).encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def feed_url(user_id: int) -> str | None:
+    if cfg.mode != "webhook" or not cfg.webhook_base or not cfg.ics_secret:
+        return None
+    path = ROUTE.format(user_id=user_id, token=feed_token(user_id))
+    return cfg.webhook_base.rstrip("/") + path
+
+
+def invalidate(user_id: int) -> None:
+    _cache.pop(user_id, None)
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    # RFC 5545: строки не длиннее 75 октетов, продолжение начинается с пробела
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts, cur = [], b""
+    for ch in line:
+        b = ch.encode("utf-8")
+        if len(cur) + len(b) > (75 if not parts else 74):
+            parts.append(cur.decode("utf-8"))
+            cur = b""
+        cur += b
+    parts.append(cur.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+async def _version(user_id: int) -> tuple:
+    user_tz = select(User.timezone).where(User.user_id == user_id).scalar_subquery()
+    async with SessionLocal() as s:
+        count, updated, tz = (await s.execute(
+            select(func.count(), func.max(Subscription.updated_at), user_tz)
+            .where(Subscription.user_id == user_id)
+        )).one()
+    # зона и локальная дата тоже часть версии: по ним _render отсекает прошедшие списания
+    tz = tz or cfg.default_tz
+    return count, updated, tz, now_in(tz).date()
+
+
+async def _render(user_id: int) -> bytes:
+    async with SessionLocal() as s:
+        u = await s.get(User, user_id)
+        subs = (await s.execute(
+            select(Subscription).where(
+                Subscription.user_id == user_id,
+                Subscription.deleted_at.is_(None),
+            )
+        )).scalars().all()
+
+    tz = (u.timezone if u else None) or cfg.default_tz
+    today = now_in(tz).date()
+    until = today + timedelta(days=HORIZON_DAYS)
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//sub_tracker_bot//RU",
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:Списания подписок",
+    ]
+    for sub in subs:
+        start = max(sub.next_charge_date, today)
+        summary = _escape(f"{sub.name} — {sub.amount} {sub.currency}")
+        # DTSTAMP — от данных, а не от времени отрисовки: тело и ETag при
+        # перерисовке (рестарт, вытеснение из кэша, другой инстанс) не меняются
+        stamp = sub.updated_at.strftime("%Y%m%dT%H%M%SZ")
+        for d in iter_charge_dates(
+            sub.billing_period, sub.charge_day, sub.charge_month, sub.charge_dom, start, until
+        ):
+            lines.extend([
+                "BEGIN:VEVENT",
+                f"UID:{sub.id}-{d:%Y%m%d}@sub_tracker_bot",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART;VALUE=DATE:{d:%Y%m%d}",
+                f"DTEND;VALUE=DATE:{d + timedelta(days=1):%Y%m%d}",
+                _fold(f"SUMMARY:{summary}"),
+                "TRANSP:TRANSPARENT",
+                "END:VEVENT",
+            ])
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+async def get_feed(user_id: int) -> tuple[str, bytes]:
+    now = time.monotonic()
+    cached = _cache.get(user_id)
+    if cached and now - cached[1] < VERSION_CHECK_SECONDS:
+        _cache.move_to_end(user_id)
+        return cached[2], cached[3]
+
+    version = await _version(user_id)
+    if cached and cached[0] == version:
+        _cache[user_id] = (version, now, cached[2], cached[3])
+        _cache.move_to_end(user_id)
+        return cached[2], cached[3]
+
+    body = await _render(user_id)
+    etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+    _cache[user_id] = (version, now, etag, body)
+    _cache.move_to_end(user_id)
+    while len(_cache) > MAX_CACHED:
+        _cache.popitem(last=False)
+    return etag, body
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def handle_ics(request: web.Request):
+    try:
+        user_id = int(request.match_info["user_id"])
+    except ValueError:
+        raise web.HTTPNotFound()
+    if not cfg.ics_secret or not hmac.compare_digest(request.match_info["token"], feed_token(user_id)):
+        raise web.HTTPNotFound()
+
+    etag, body = await get_feed(user_id)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=headers)
+
+    return web.Response(body=body, content_type="text/calendar", charset="utf-8", headers=headers)
+
+
+def setup_routes(app: web.Application) -> None:
+    app.router.add_get(ROUTE, handle_ics)
@@ -0,0 +1,94 @@
+import csv
+import io
+from typing import Any, Dict, List, Tuple
+
+from app.validators import parse_amount, parse_currency, parse_day, parse_month
+
+MAX_ROWS = 200
+
+PERIODS = {
+    "monthly": "monthly", "month": "monthly", "ежемесячно": "monthly", "мес": "monthly", "месяц": "monthly",
+    "yearly": "yearly", "year": "yearly", "annual": "yearly", "раз в год": "yearly", "год": "yearly",
+}
+HEADER_NAMES = {"name", "название", "сервис"}
+
+FORMAT_HELP = (
+    "Одна подписка на строку, поля через «;»:\n"
+    "название; сумма; валюта; monthly; день\n"
+    "название; сумма; валюта; yearly; месяц; день\n\n"
+    "Например:\n"
+    "Netflix; 9.99; EUR; monthly; 15\n"
+    "iCloud; 29,99; USD; yearly; 3; 1"
+)
+
+
+def _split_rows(text: str) -> List[Tuple[int, List[str]]]:
+    # (номер строки в документе, поля); пустые строки и #-комментарии пропускаем
+    lines = [(n, ln) for n, ln in enumerate(text.splitlines(), 1) if ln.strip() and not ln.lstrip().startswith("#")]
+    sample = "\n".join(ln for _, ln in lines[:10])
+    delimiter = ";" if ";" in sample else "\t" if "\t" in sample else ","
+    return [(n, [c.strip() for c in next(csv.reader([ln], delimiter=delimiter))]) for n, ln in lines]
+
+
+def parse_import(text: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Разбирает документ в данные формата AddSub. Возвращает (валидные строки, ошибки)."""
+    rows = _split_rows(text)
+    if rows and rows[0][1][0].lower() in HEADER_NAMES:
+        rows = rows[1:]
+
+    items: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    if len(rows) > MAX_ROWS:
+        errors.append(f"Слишком много строк: беру первые {MAX_ROWS}.")
+        rows = rows[:MAX_ROWS]
+
+    for n, row in rows:
+        if len(row) < 5:
+            errors.append(f"Строка {n}: мало полей")
+            continue
+
+        name = row[0][:128]
+        amount = parse_amount(row[1])
+        currency = parse_currency(row[2])
+        period = PERIODS.get(row[3].lower())
+
+        if not name:
+            errors.append(f"Строка {n}: пустое название")
+            continue
+        if amount is None:
+            errors.append(f"Строка {n}: не похоже на сумму «{row[1]}»")
+            continue
+        if currency is None:
+            errors.append(f"Строка {n}: код валюты буквами, а не «{row[2]}»")
+            continue
+        if period is None:
+            errors.append(f"Строка {n}: период monthly или yearly, а не «{row[3]}»")
+            continue
+
+        data: Dict[str, Any] = {"name": name, "amount": str(amount), "currency": currency, "period": period}
+        if period == "monthly":
+            day = parse_day(row[4])
+            if day is None:
+                errors.append(f"Строка {n}: день от 1 до 31")
+                continue
+            data["charge_day"] = day
+        else:
+            month = parse_month(row[4])
+            day = parse_day(row[5]) if len(row) > 5 else None
+            if month is None or day is None:
+                errors.append(f"Строка {n}: для yearly нужны месяц (1–12) и день (1–31)")
+                continue
+            data["charge_month"] = month
+            data["charge_dom"] = day
+
+        items.append(data)
+
+    return items, errors
+
+
+def decode_upload(buf: io.BytesIO) -> str:
+    raw = buf.getvalue()
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode("cp1251")
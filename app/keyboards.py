@@ -1,13 +1,18 @@
 ﻿from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from app.render import ItemRowTemplate, RowTemplate, keyboard, prebuilt, static_row
+
+@prebuilt
 def main_menu_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="➕ Добавить подписку", callback_data="menu:add")
     kb.button(text="📋 Все мои подписки", callback_data="menu:list")
+    kb.button(text="🗓 Ближайшие списания", callback_data="menu:upcoming")
     kb.adjust(1)
     return kb.as_markup()
 
+@prebuilt
 def currency_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     for c in ["EUR", "USD", "RUB"]:
@@ -16,6 +21,7 @@ def currency_kb() -> InlineKeyboardMarkup:
     kb.adjust(3, 1)
     return kb.as_markup()
 
+@prebuilt
 def period_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="Ежемесячно", callback_data="add:per:monthly")
@@ -23,6 +29,7 @@ def period_kb() -> InlineKeyboardMarkup:
     kb.adjust(2)
     return kb.as_markup()
 
+@prebuilt
 def confirm_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="✅ Сохранить", callback_data="add:save")
@@ -31,6 +38,7 @@ def confirm_kb() -> InlineKeyboardMarkup:
     kb.adjust(1)
     return kb.as_markup()
 
+@prebuilt
 def list_actions_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="⚙️ Управлять подписками", callback_data="subs:manage")
@@ -38,30 +46,43 @@ def list_actions_kb() -> InlineKeyboardMarkup:
     kb.adjust(1)
     return kb.as_markup()
 
+# ok_kb уходит с каждым напоминанием, sub_card_kb/how_cancel_kb — на каждое
+# открытие карточки: ряды готовы заранее, подставляется только id
+_OK_ROW = RowTemplate(("✅ Ок", "ok:"))
+
+_SUB_CARD_ROWS = (
+    RowTemplate(("🔕 Отключить напоминания", "sub:disable:")),
+    RowTemplate(("🗑 Удалить из списка", "sub:delete:")),
+    RowTemplate(("📎 Как отменить в сервисе", "sub:how:")),
+)
+_BACK_TO_MANAGE = static_row(("↩️ Назад", "subs:manage"))
+
+# списки подписок («Управлять подписками», /find): ряд на подписку
+_OPEN_SUB_ROW = ItemRowTemplate("sub:open:")
+_BACK_TO_LIST = static_row(("↩️ Назад", "menu:list"))
+MANAGE_LIMIT = 40  # MVP лимит
+
+_HOW_CANCEL_ROWS = (
+    RowTemplate((" Apple ID", "cancel:apple:"), ("▶️ Google Play", "cancel:google:")),
+    RowTemplate(("🌐 На сайте", "cancel:web:"), ("❓ Не помню", "cancel:unknown:")),
+    RowTemplate(("↩️ Назад", "sub:open:")),
+)
+
 def ok_kb(kind: str, reminder_id: str) -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    kb.button(text="✅ Ок", callback_data=f"ok:{kind}:{reminder_id}")
-    kb.adjust(1)
-    return kb.as_markup()
+    return keyboard(_OK_ROW.render(f"{kind}:{reminder_id}"))
 
 def sub_card_kb(sub_id: str) -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    kb.button(text="🔕 Отключить напоминания", callback_data=f"sub:disable:{sub_id}")
-    kb.button(text="🗑 Удалить из списка", callback_data=f"sub:delete:{sub_id}")
-    kb.button(text="📎 Как отменить в сервисе", callback_data=f"sub:how:{sub_id}")
-    kb.button(text="↩️ Назад", callback_data="subs:manage")
-    kb.adjust(1)
-    return kb.as_markup()
+    return keyboard(*(row.render(sub_id) for row in _SUB_CARD_ROWS), _BACK_TO_MANAGE)
+
+def manage_kb(subs) -> InlineKeyboardMarkup:
+    rows = (_OPEN_SUB_ROW.render(sub.name, str(sub.id)) for sub in subs[:MANAGE_LIMIT])
+    return keyboard(*rows, _BACK_TO_LIST)
+
+def search_results_kb(results) -> InlineKeyboardMarkup:
+    return keyboard(*(_OPEN_SUB_ROW.render(f"{r.name} — {r.amount} {r.currency}", str(r.id)) for r in results))
 
 def how_cancel_kb(sub_id: str) -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    kb.button(text=" Apple ID", callback_data=f"cancel:apple:{sub_id}")
-    kb.button(text="▶️ Google Play", callback_data=f"cancel:google:{sub_id}")
-    kb.button(text="🌐 На сайте", callback_data=f"cancel:web:{sub_id}")
-    kb.button(text="❓ Не помню", callback_data=f"cancel:unknown:{sub_id}")
-    kb.button(text="↩️ Назад", callback_data=f"sub:open:{sub_id}")
-    kb.adjust(2, 2, 1)
-    return kb.as_markup()
+    return keyboard(*(row.render(sub_id) for row in _HOW_CANCEL_ROWS))
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
 def bottom_menu_kb() -> ReplyKeyboardMarkup:
@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import text
+
+from app import metrics, querytrace
+from app.config import load_config
+from app.db import SessionLocal, init_db
+from app.handlers import setup as setup_handlers
+from app.middlewares import setup as setup_middlewares
+from app.profiling import ApiTimingMiddleware
+
+cfg = load_config()
+
+# Нагрузка на FSM-сценарии бота: тысячи виртуальных пользователей шлют апдейты
+# через dp.feed_update() с паузами «на подумать», Bot API заглушен в процессе.
+# Запуск на локальной БД:
+#   python -m app.loadtest --users 2000 --duration 120 --think-ms 2000
+# По каждому шагу сценария: p50/p99 хендлера, SQL, ожидание пула, ошибки.
+
+LOAD_USER_BASE = 8_000_000_000_000
+NAMES = ["Netflix", "Spotify", "iCloud", "VPN", "YouTube Premium", "Кинопоиск", "Notion"]
+
+
+class StubSession(BaseSession):
+    """Сессия без сети: ответ Bot API собирается на месте и проходит обычный check_response."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.calls: Dict[str, int] = defaultdict(int)
+        # chat_id -> клавиатура последнего сообщения: виртуальный пользователь «жмёт» по ней
+        self.last_markup: Dict[int, Any] = {}
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None):
+        if self.latency_ms:
+            await asyncio.sleep(random.expovariate(1 / self.latency_ms) / 1000)
+        self.calls[type(method).__name__] += 1
+
+        result: Any = True
+        if isinstance(method, SendMessage):
+            self._message_id += 1
+            self.last_markup[method.chat_id] = method.reply_markup
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": method.chat_id, "type": "private"},
+                "text": method.text,
+            }
+        response = self.check_response(bot, method, 200, json.dumps({"ok": True, "result": result}))
+        return response.result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+class StepSample:
+    __slots__ = ("statements", "db_time", "pool_wait")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+
+
+_sample: ContextVar[Optional[StepSample]] = ContextVar("loadtest_sample", default=None)
+
+
+class SampleMiddleware(BaseMiddleware):
+    """Самый внутренний: после хендлера забирает из querytrace SQL и ожидание пула этого апдейта."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            sample, tr = _sample.get(), querytrace.current()
+            if sample is not None and tr is not None:
+                sample.statements, sample.db_time, sample.pool_wait = tr.count, tr.db_time, tr.pool_wait
+
+
+class Stats:
+    def __init__(self):
+        self.latency: Dict[str, list] = defaultdict(list)
+        self.db: Dict[str, list] = defaultdict(list)
+        self.pool: Dict[str, list] = defaultdict(list)
+        self.statements: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+class VirtualUser:
+    def __init__(self, harness: "Harness", user_id: int, rng: random.Random):
+        self.h = harness
+        self.user_id = user_id
+        self.rng = rng
+        self.message_id = 0
+
+    def _base(self) -> dict:
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+        }
+
+    def _from(self) -> dict:
+        return {"id": self.user_id, "is_bot": False, "first_name": "load", "language_code": "ru"}
+
+    async def think(self) -> None:
+        # логнормальная пауза: чаще быстро, иногда долго
+        await asyncio.sleep(self.rng.lognormvariate(0, 0.6) * self.h.think_ms / 1000)
+
+    async def send(self, step: str, text_: str) -> None:
+        msg = {**self._base(), "from": self._from(), "text": text_}
+        await self.h.feed(step, {"message": msg})
+
+    async def press(self, step: str, data: str) -> None:
+        cb = {
+            "id": f"{self.user_id}-{self.message_id}",
+            "from": self._from(),
+            "chat_instance": "load",
+            "data": data,
+            "message": {**self._base(), "text": "…"},
+        }
+        await self.h.feed(step, {"callback_query": cb})
+
+    def buttons(self, prefix: str) -> list[str]:
+        markup = self.h.session.last_markup.get(self.user_id)
+        rows = getattr(markup, "inline_keyboard", None) or []
+        return [b.callback_data for row in rows for b in row if (b.callback_data or "").startswith(prefix)]
+
+    async def flow_add(self) -> None:
+        await self.press("add:menu", "menu:add")
+        await self.think()
+        await self.send("add:name", self.rng.choice(NAMES))
+        await self.think()
+        await self.send("add:amount", self.rng.choice(("4.99", "9,99", "12.5", "199")))
+        await self.think()
+        await self.press("add:currency", f"add:cur:{self.rng.choice(('EUR', 'USD', 'RUB'))}")
+        await self.think()
+        if self.rng.random() < 0.8:
+            await self.press("add:period", "add:per:monthly")
+            await self.think()
+            await self.send("add:day", str(self.rng.randint(1, 31)))
+        else:
+            await self.press("add:period", "add:per:yearly")
+            await self.think()
+            await self.send("add:month", str(self.rng.randint(1, 12)))
+            await self.think()
+            await self.send("add:day", str(self.rng.randint(1, 31)))
+        await self.think()
+        await self.press("add:confirm", "add:save")
+
+    async def flow_list(self) -> None:
+        await self.send("list", "/list")
+
+    async def flow_manage(self) -> None:
+        await self.press("manage", "subs:manage")
+        subs = self.buttons("sub:open:")
+        if not subs:
+            return
+        await self.think()
+        sub_data = self.rng.choice(subs)
+        await self.press("sub:open", sub_data)
+        await self.think()
+        sub_id = sub_data.rsplit(":", 1)[-1]
+        if self.rng.random() < 0.5:
+            await self.press("sub:disable", f"sub:disable:{sub_id}")
+        else:
+            await self.press("sub:delete", f"sub:delete:{sub_id}")
+
+    async def run(self, deadline: float) -> None:
+        await self.send("start", "/start")
+        flows = [(self.flow_add, 4), (self.flow_list, 4), (self.flow_manage, 2)]
+        while time.monotonic() < deadline:
+            await self.think()
+            flow = self.rng.choices([f for f, _ in flows], weights=[w for _, w in flows])[0]
+            await flow()
+
+
+class Harness:
+    def __init__(self, api_latency_ms: float, think_ms: float):
+        self.think_ms = think_ms
+        self.session = StubSession(api_latency_ms)
+        self.bot = Bot(token=cfg.bot_token, session=self.session)
+        self.bot.session.middleware(ApiTimingMiddleware())
+        self.dp = Dispatcher()
+        setup_middlewares(self.dp)
+        self.dp.message.middleware(SampleMiddleware())
+        self.dp.callback_query.middleware(SampleMiddleware())
+        setup_handlers(self.dp)
+        self.stats = Stats()
+        self._update_id = 0
+
+    async def feed(self, step: str, payload: dict) -> None:
+        self._update_id += 1
+        update = Update.model_validate({"update_id": self._update_id, **payload}, context={"bot": self.bot})
+        sample = StepSample()
+        token = _sample.set(sample)
+        t0 = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.stats.errors[step][type(e).__name__] += 1
+        finally:
+            _sample.reset(token)
+            st = self.stats
+            st.latency[step].append(time.perf_counter() - t0)
+            st.db[step].append(sample.db_time)
+            st.pool[step].append(sample.pool_wait)
+            st.statements[step] += sample.statements
+
+
+async def cleanup(first: int, last: int) -> None:
+    params = {"a": first, "b": last}
+    async with SessionLocal() as s:
+        await s.execute(text("""
+            DELETE FROM reminders WHERE subscription_id IN (
+              SELECT id FROM subscriptions WHERE user_id BETWEEN :a AND :b
+            )
+        """), params)
+        await s.execute(text("DELETE FROM subscriptions WHERE user_id BETWEEN :a AND :b"), params)
+        await s.execute(text("DELETE FROM events WHERE user_id BETWEEN :a AND :b"), params)
+        await s.execute(text("DELETE FROM events_outbox WHERE user_id BETWEEN :a AND :b"), params)
+        await s.execute(text("DELETE FROM users WHERE user_id BETWEEN :a AND :b"), params)
+        await s.commit()
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0.0
+
+
+def report(stats: Stats, wall: float) -> None:
+    total = sum(len(v) for v in stats.latency.values())
+    print(f"{total} updates in {wall:.1f} s: {total / wall:.1f} updates/s")
+    print(f"{'step':14s} {'n':>6s} {'p50 ms':>8s} {'p99 ms':>8s} {'db p50':>8s} {'pool p99':>9s} {'sql/upd':>8s}  errors")
+    for step in sorted(stats.latency):
+        lat = stats.latency[step]
+        errors = ", ".join(f"{k} {v}" for k, v in stats.errors[step].items()) or "-"
+        print(f"{step:14s} {len(lat):6d} {_pct(lat, 0.5):8.1f} {_pct(lat, 0.99):8.1f} "
+              f"{_pct(stats.db[step], 0.5):8.1f} {_pct(stats.pool[step], 0.99):9.1f} "
+              f"{stats.statements[step] / len(lat):8.1f}  {errors}")
+    checkouts = metrics.db_pool_checkouts.values.get((), 0)
+    waits = metrics.db_pool_waits.values.get((), 0)
+    print(f"pool: {int(checkouts)} checkouts, {int(waits)} waited for a free connection")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузка на сценарии бота виртуальными пользователями")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60.0, help="секунд после разгона")
+    parser.add_argument("--ramp", type=float, default=10.0, help="за сколько секунд стартуют все пользователи")
+    parser.add_argument("--think-ms", type=float, default=2000.0)
+    parser.add_argument("--api-latency-ms", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="не удалять созданные данные")
+    args = parser.parse_args()
+
+    # лог aiogram пишет строку на каждый апдейт
+    logging.basicConfig(level=logging.WARNING)
+
+    # пул как у бота: ожидание соединения в отчёте — то же, что в проде
+    init_db("bot")
+    harness = Harness(args.api_latency_ms, args.think_ms)
+    rng = random.Random(args.seed)
+    first, last = LOAD_USER_BASE, LOAD_USER_BASE + args.users - 1
+    deadline = time.monotonic() + args.ramp + args.duration
+
+    async def start_user(i: int) -> None:
+        await asyncio.sleep(args.ramp * i / max(args.users, 1))
+        await VirtualUser(harness, first + i, random.Random(rng.random())).run(deadline)
+
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(*(start_user(i) for i in range(args.users)))
+    finally:
+        wall = time.perf_counter() - t0
+        if not args.keep:
+            await cleanup(first, last)
+
+    report(harness.stats, wall)
+    print("Bot API calls: " + ", ".join(f"{k} {v}" for k, v in sorted(harness.session.calls.items())))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+import time
+from bisect import bisect_left
+from typing import Dict, Sequence, Tuple
+
+from aiohttp import web
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import querytrace
+
+# Метрики в памяти процесса, формат Prometheus text 0.0.4.
+# Запись — это поиск в dict по кортежу меток и сложение, без блокировок:
+# и бот, и воркер однопоточные (asyncio).
+
+Labels = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list = []
+
+
+def _fmt_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.values: Dict[Labels, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels: str, n: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + n
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for lv, v in self.values.items():
+            out.append(f"{self.name}{_fmt_labels(self.labels, lv)} {v}")
+        return out
+
+
+class Gauge(Counter):
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    def dec(self, *labels: str, n: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) - n
+
+    def render(self) -> list[str]:
+        out = super().render()
+        out[1] = f"# TYPE {self.name} gauge"
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по бакетам (+Inf последним), сумма]
+        self.values: Dict[Labels, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        st = self.values.get(labels)
+        if st is None:
+            st = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        st[0][bisect_left(self.buckets, value)] += 1
+        st[1] += value
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for lv, (counts, total) in self.values.items():
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le_s = "+Inf" if le == float("inf") else repr(le)
+                le_label = f'le="{le_s}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, lv, le_label)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, lv)} {total}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, lv)} {acc}")
+        return out
+
+
+def render() -> str:
+    lines: list[str] = []
+    for m in _registry:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- воркер ---
+queue_depth = Gauge("reminder_queue_depth", "Pending reminders that are already due")
+queue_lag = Gauge("reminder_queue_lag_seconds", "now() minus the oldest due pending remind_at_utc")
+worker_stage_seconds = Histogram("worker_stage_seconds", "Worker stage latency", ["stage"])  # claim|send|commit
+reminder_sends = Counter("reminder_sends_total", "Reminder delivery attempts by outcome", ["outcome"])
+
+# --- бот ---
+handler_seconds = Histogram("handler_seconds", "Handler latency by callback prefix or message kind", ["prefix"])
+
+# --- общее ---
+db_pool_checkouts = Counter("db_pool_checkouts_total", "Connections taken from the SQLAlchemy pool")
+db_pool_waits = Counter("db_pool_waits_total", "Checkouts that found the pool exhausted and had to wait")
+db_pool_checkout_seconds = Histogram("db_pool_checkout_seconds", "Time to obtain a pooled connection")
+db_pool_connections = Gauge("db_pool_connections", "SQLAlchemy pool connections by state", ["state"])  # idle|in_use|overflow
+db_liveness_failures = Counter("db_liveness_failures_total", "Background SELECT 1 checks that failed and disposed the pool")
+outbox_depth = Gauge("analytics_outbox_depth", "Analytics events in events_outbox not yet relayed to events")
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, который считает выдачи соединений и ожидания."""
+
+    def connect(self):
+        saturated = self._max_overflow > -1 and self._overflow >= self._max_overflow and self._pool.empty()
+        t0 = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            db_pool_checkouts.inc()
+            if saturated:
+                db_pool_waits.inc()
+            elapsed = time.perf_counter() - t0
+            db_pool_checkout_seconds.observe(elapsed)
+            querytrace.record_pool_wait(elapsed)
+
+
+async def handle_metrics(request: web.Request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    # отдельный маленький HTTP-листенер (воркер и бот в любом режиме);
+    # в публичное webhook-приложение /metrics не попадает
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
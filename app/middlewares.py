@@ -0,0 +1,197 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import CallbackQuery, InlineQuery, TelegramObject
+
+from app import metrics, querytrace
+from app.profiling import ProfilingMiddleware
+from app.config import load_config
+
+cfg = load_config()
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Токен-бакет на пользователя + антидребезг одинаковых callback'ов.
+
+    Срабатывает до хендлеров, т.е. до открытия сессии БД. Записи пользователей,
+    которые давно молчат, вытесняются, так что память ограничена.
+    """
+
+    def __init__(self, rate: float, burst: int, debounce_seconds: float, idle_seconds: float, max_entries: int):
+        self.rate = rate
+        self.burst = float(burst)
+        self.debounce_seconds = debounce_seconds
+        self.idle_seconds = idle_seconds
+        self.max_entries = max_entries
+        # user_id -> [токены, время пополнения, последний callback data, когда он был]
+        self._users: "OrderedDict[int, list]" = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        users = self._users
+        while users:
+            _, entry = next(iter(users.items()))
+            if len(users) <= self.max_entries and now - entry[1] < self.idle_seconds:
+                break
+            users.popitem(last=False)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        entry = self._users.get(user.id)
+        if entry is None:
+            entry = [self.burst, now, None, 0.0]
+            self._users[user.id] = entry
+            self._evict(now)
+        else:
+            self._users.move_to_end(user.id)
+            entry[0] = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+            entry[1] = now
+
+        if isinstance(event, CallbackQuery):
+            # повторное нажатие той же кнопки: только гасим «часики» на кнопке
+            if event.data == entry[2] and now - entry[3] < self.debounce_seconds:
+                await _answer_quietly(event)
+                return None
+            entry[2], entry[3] = event.data, now
+
+        if entry[0] < 1:
+            if isinstance(event, CallbackQuery):
+                await _answer_quietly(event, "Слишком часто, подожди немного")
+            return None
+
+        entry[0] -= 1
+        return await handler(event, data)
+
+
+class InlineCoalesceMiddleware(BaseMiddleware):
+    """Inline-запрос приходит на каждое нажатие клавиши: ждём паузу в наборе
+    и отвечаем только на последний, вытесненные запросы отбрасываем."""
+
+    def __init__(self, delay_seconds: float, max_entries: int):
+        self.delay_seconds = delay_seconds
+        self.max_entries = max_entries
+        # user_id -> id последнего inline-запроса
+        self._latest: "OrderedDict[int, str]" = OrderedDict()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or not isinstance(event, InlineQuery):
+            return await handler(event, data)
+
+        latest = self._latest
+        latest[user.id] = event.id
+        latest.move_to_end(user.id)
+        while len(latest) > self.max_entries:
+            latest.popitem(last=False)
+
+        await asyncio.sleep(self.delay_seconds)
+        if latest.get(user.id) != event.id:
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            if latest.get(user.id) == event.id:
+                del latest[user.id]
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время хендлера по префиксу callback data (menu, sub, ok...) или по типу сообщения."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, CallbackQuery):
+            prefix = (event.data or "").split(":", 1)[0]
+        else:
+            # для сообщений — имя хендлера: набор меток конечен, в отличие от текста
+            h = data.get("handler")
+            prefix = h.callback.__name__ if h is not None else "message"
+
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - t0, prefix)
+
+
+class QueryTraceMiddleware(BaseMiddleware):
+    """Считает SQL-запросы апдейта и сверяет с бюджетом из @query_budget хендлера."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        h = data.get("handler")
+        fn = h.callback if h is not None else None
+        name = getattr(fn, "__name__", "update")
+        with querytrace.trace(name, getattr(fn, "__query_budget__", None)):
+            return await handler(event, data)
+
+
+async def _answer_quietly(cb: CallbackQuery, text: str | None = None) -> None:
+    try:
+        await cb.answer(text)
+    except Exception:
+        pass
+
+
+def setup(dp: Dispatcher):
+    throttling = ThrottlingMiddleware(
+        rate=cfg.throttle_rate,
+        burst=cfg.throttle_burst,
+        debounce_seconds=cfg.callback_debounce_ms / 1000,
+        idle_seconds=cfg.throttle_idle_seconds,
+        max_entries=cfg.throttle_max_users,
+    )
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+
+    # inline-запрос уходит на каждое нажатие клавиши: сначала схлопываем набор,
+    # и у inline свой бакет — поиск не съедает токены /list и кнопок
+    dp.inline_query.outer_middleware(InlineCoalesceMiddleware(
+        delay_seconds=cfg.inline_debounce_ms / 1000,
+        max_entries=cfg.throttle_max_users,
+    ))
+    dp.inline_query.outer_middleware(ThrottlingMiddleware(
+        rate=cfg.throttle_rate,
+        burst=cfg.throttle_burst,
+        debounce_seconds=0,
+        idle_seconds=cfg.throttle_idle_seconds,
+        max_entries=cfg.throttle_max_users,
+    ))
+
+    timing = MetricsMiddleware()
+    dp.message.middleware(timing)
+    dp.callback_query.middleware(timing)
+    dp.inline_query.middleware(timing)
+
+    tracing = QueryTraceMiddleware()
+    dp.message.middleware(tracing)
+    dp.callback_query.middleware(tracing)
+    dp.inline_query.middleware(tracing)
+
+    # после tracing: берёт время БД из текущего querytrace
+    profiling = ProfilingMiddleware()
+    dp.message.middleware(profiling)
+    dp.callback_query.middleware(profiling)
@@ -1,7 +1,7 @@
 ﻿import asyncio
 from sqlalchemy import text
 
-from app.db import engine
+from app.db import get_engine, init_db
 from app.models import Base
 
 EVENTS_DDL = [
@@ -19,10 +19,71 @@ EVENTS_DDL = [
     "CREATE INDEX IF NOT EXISTS ix_events_name_ts ON events (event_name, ts_utc);",
 ]
 
+OUTBOX_DDL = [
+    # события, записанные в одной транзакции с действием; воркер переносит их в events
+    """
+    CREATE TABLE IF NOT EXISTS events_outbox (
+      id BIGSERIAL PRIMARY KEY,
+      user_id BIGINT NOT NULL,
+      event_name TEXT NOT NULL,
+      ts_utc TIMESTAMPTZ NOT NULL DEFAULT now(),
+      props JSONB NOT NULL DEFAULT '{}'::jsonb
+    );
+    """,
+]
+
+STATS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS stats_daily (
+      day DATE NOT NULL,
+      metric TEXT NOT NULL,
+      kind TEXT NOT NULL DEFAULT '',
+      value BIGINT NOT NULL,
+      PRIMARY KEY (day, metric, kind)
+    );
+    """,
+    # очередь напоминаний: /stats и воркер смотрят только на pending
+    "CREATE INDEX IF NOT EXISTS ix_reminders_pending ON reminders (remind_at_utc) WHERE status = 'pending';",
+    # reminders_acked в stats_daily считается по дню подтверждения
+    "CREATE INDEX IF NOT EXISTS ix_reminders_acked_at ON reminders (acked_at) WHERE acked_at IS NOT NULL;",
+]
+
+FX_DDL = [
+    # rate: сколько стоит 1 единица currency в FX_BASE
+    """
+    CREATE TABLE IF NOT EXISTS fx_rates (
+      currency TEXT PRIMARY KEY,
+      rate NUMERIC(18, 8) NOT NULL,
+      updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+]
+
+SEARCH_DDL = [
+    # /find и inline-поиск: триграммы по имени, user_id в том же GiST-индексе
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    "CREATE EXTENSION IF NOT EXISTS btree_gist;",
+    """
+    CREATE INDEX IF NOT EXISTS ix_subscriptions_user_name_trgm
+    ON subscriptions USING gist (user_id, name gist_trgm_ops) WHERE deleted_at IS NULL;
+    """,
+]
+
+INDEXES_DDL = [
+    # rollover идёт по зонам: users по timezone -> их subscriptions
+    "CREATE INDEX IF NOT EXISTS ix_users_timezone ON users (timezone);",
+    # /upcoming: списания пользователя в окне дат
+    """
+    CREATE INDEX IF NOT EXISTS ix_subscriptions_user_next_charge
+    ON subscriptions (user_id, next_charge_date) WHERE deleted_at IS NULL;
+    """,
+]
+
 async def main():
-    async with engine.begin() as conn:
+    init_db("cli")
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-        for stmt in EVENTS_DDL:
+        for stmt in EVENTS_DDL + OUTBOX_DDL + STATS_DDL + FX_DDL + SEARCH_DDL + INDEXES_DDL:
             await conn.execute(text(stmt))
 
 if __name__ == "__main__":
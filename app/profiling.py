@@ -0,0 +1,108 @@
+import cProfile
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from app import querytrace
+from app.config import load_config
+
+cfg = load_config()
+logger = logging.getLogger(__name__)
+
+
+class ProfilingSettings:
+    """Переключается на лету командой /profile, без рестарта."""
+
+    def __init__(self):
+        self.enabled = cfg.profile_enabled
+        self.sample_rate = cfg.profile_sample_rate
+        self.slow_ms = cfg.profile_slow_ms
+        self.out_dir = cfg.profile_dir
+
+
+settings = ProfilingSettings()
+
+# суммарное время запросов к Bot API внутри текущего апдейта
+_api_time: ContextVar[Optional[list]] = ContextVar("profiling_api_time", default=None)
+_profiler_busy = False
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: меряет время вызовов Bot API для текущего апдейта."""
+
+    async def __call__(self, make_request, bot, method):
+        acc = _api_time.get()
+        if acc is None:
+            return await make_request(bot, method)
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            acc[0] += time.perf_counter() - t0
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Время хендлера: всего / БД / Bot API; для доли медленных апдейтов — cProfile на диск."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not settings.enabled:
+            return await handler(event, data)
+
+        global _profiler_busy
+        h = data.get("handler")
+        name = getattr(h.callback, "__name__", "update") if h is not None else "update"
+
+        acc = [0.0]
+        token = _api_time.set(acc)
+        tr = querytrace.current()
+        db_before = tr.db_time if tr else 0.0
+
+        # cProfile один на процесс: пока он пишет, остальные апдейты не профилируем
+        prof = None
+        if not _profiler_busy and random.random() < settings.sample_rate:
+            prof = cProfile.Profile()
+            _profiler_busy = True
+            prof.enable()
+
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            wall = time.perf_counter() - t0
+            if prof is not None:
+                prof.disable()
+                _profiler_busy = False
+            _api_time.reset(token)
+
+            if wall * 1000 >= settings.slow_ms:
+                db = (tr.db_time - db_before) if tr else 0.0
+                api = acc[0]
+                logger.info(
+                    "slow update %s: %.1f ms (db %.1f ms, api %.1f ms, other %.1f ms)",
+                    name, wall * 1000, db * 1000, api * 1000, max(wall - db - api, 0.0) * 1000,
+                )
+                if prof is not None:
+                    _dump(prof, name)
+
+
+def _dump(prof: cProfile.Profile, name: str) -> None:
+    # профиль захватывает и чужие корутины, которые работали в это время
+    try:
+        os.makedirs(settings.out_dir, exist_ok=True)
+        path = os.path.join(settings.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}.prof")
+        prof.dump_stats(path)
+        logger.info("profile saved: %s", path)
+    except Exception:
+        logger.exception("failed to save profile")
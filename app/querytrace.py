@@ -0,0 +1,114 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import load_config
+
+cfg = load_config()
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Trace:
+    """Счётчик SQL-запросов и времени БД в рамках одного апдейта или пачки воркера."""
+
+    __slots__ = ("name", "budget", "count", "db_time", "pool_wait", "slow", "started")
+
+    def __init__(self, name: str, budget: Optional[int] = None):
+        self.name = name
+        self.budget = budget
+        self.count = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.slow: list[tuple[float, str]] = []
+        self.started = time.perf_counter()
+
+    def add(self, elapsed: float, statement: str) -> None:
+        self.count += 1
+        self.db_time += elapsed
+        if elapsed * 1000 >= cfg.query_slow_ms:
+            self.slow.append((elapsed, " ".join(statement.split())[:300]))
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("querytrace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def record(elapsed: float, statement: str) -> None:
+    # для запросов мимо SQLAlchemy (например, сырой asyncpg)
+    tr = _current.get()
+    if tr is not None:
+        tr.add(elapsed, statement)
+
+
+def record_pool_wait(elapsed: float) -> None:
+    # время получения соединения из пула (см. metrics.InstrumentedPool)
+    tr = _current.get()
+    if tr is not None:
+        tr.pool_wait += elapsed
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("querytrace_t0", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["querytrace_t0"].pop()
+    record(elapsed, statement)
+
+
+def install(engine: AsyncEngine) -> None:
+    event.listen(engine.sync_engine, "before_cursor_execute", _before)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after)
+
+
+def _report(tr: Trace) -> None:
+    total = time.perf_counter() - tr.started
+    over_budget = tr.budget is not None and tr.count > tr.budget
+
+    if over_budget:
+        logger.warning(
+            "query budget exceeded: %s ran %d statements (budget %d), db %.1f ms",
+            tr.name, tr.count, tr.budget, tr.db_time * 1000,
+        )
+    if tr.slow and random.random() < cfg.query_trace_sample:
+        lines = [f"  {elapsed * 1000:.1f} ms  {sql}" for elapsed, sql in sorted(tr.slow, reverse=True)]
+        logger.info(
+            "slow statements in %s: %d statements, db %.1f ms of %.1f ms\n%s",
+            tr.name, tr.count, tr.db_time * 1000, total * 1000, "\n".join(lines),
+        )
+    if over_budget and cfg.query_budget_strict:
+        raise QueryBudgetExceeded(f"{tr.name}: {tr.count} statements, budget {tr.budget}")
+
+
+@contextmanager
+def trace(name: str, budget: Optional[int] = None):
+    tr = Trace(name, budget)
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+    _report(tr)
+
+
+def query_budget(n: int) -> Callable:
+    """Объявляет, сколько SQL-запросов хендлеру можно сделать за один апдейт."""
+
+    def deco(fn):
+        fn.__query_budget__ = n
+        return fn
+
+    return deco
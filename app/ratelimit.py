@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """Общий бюджет отправок в Telegram: токен-бакет с двумя приоритетами.
+
+    Высокий приоритет (напоминания) берёт любой токен. Низкий (рассылки) — только
+    если никто из высокого не ждёт и в бакете остаётся запас сверх reserve,
+    поэтому рассылка забирает лишь то, что напоминания не используют.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None, reserve: float | None = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self.reserve = self.capacity / 2 if reserve is None else reserve
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._high_waiting = 0
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        # например, после 429 retry_after: стоят все, и напоминания, и рассылки
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, high: bool = True) -> None:
+        if high:
+            self._high_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill(now)
+                need = 1.0 if high else 1.0 + self.reserve
+                if self._tokens >= need and (high or self._high_waiting == 0):
+                    self._tokens -= 1.0
+                    return
+
+                await asyncio.sleep(max((need - self._tokens) / self.rate, 0.005))
+        finally:
+            if high:
+                self._high_waiting -= 1
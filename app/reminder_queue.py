@@ -0,0 +1,131 @@
+import time
+import uuid
+from typing import Optional, Sequence
+
+import asyncpg
+
+from app import querytrace
+from app.config import load_config
+
+cfg = load_config()
+
+# Очередь напоминаний для воркера на голом asyncpg: без ORM, identity map и
+# dirty-tracking. asyncpg сам готовит (PREPARE) и кэширует каждый из этих
+# запросов на соединении, так что повторные вызовы идут по готовому плану
+# (кроме DB_PGBOUNCER=1: там кэш выключен, см. statement_cache_size()).
+
+CLAIM_SQL = """
+    WITH picked AS (
+      SELECT id
+      FROM reminders
+      WHERE status = 'pending' AND remind_at_utc <= $2
+      ORDER BY remind_at_utc
+      LIMIT $1
+      FOR UPDATE SKIP LOCKED
+    )
+    UPDATE reminders
+    SET status = 'sending'
+    WHERE id IN (SELECT id FROM picked)
+    RETURNING id
+"""
+
+# Всё, что нужно для отправки, одним запросом: текст, получатель и
+# можно ли вообще слать (подписка жива, D3 для этой даты ещё не подтверждён).
+HYDRATE_SQL = """
+    SELECT r.id, r.kind, r.charge_date,
+           s.user_id, s.name, s.amount::text AS amount, s.currency,
+           (s.deleted_at IS NULL AND s.is_active) AS sub_ok,
+           (r.kind = 'D1' AND EXISTS (
+              SELECT 1 FROM reminders d3
+              WHERE d3.subscription_id = r.subscription_id
+                AND d3.charge_date = r.charge_date
+                AND d3.kind = 'D3'
+                AND d3.acked_at IS NOT NULL
+           )) AS d3_acked
+    FROM reminders r
+    JOIN subscriptions s ON s.id = r.subscription_id
+    WHERE r.id = ANY($1::uuid[]) AND r.status = 'sending'
+"""
+
+# исходы пишем только поверх своего 'sending', как и REQUEUE_SQL: строку,
+# которую к этому времени поменял кто-то другой, не перетираем
+MARK_SENT_SQL = "UPDATE reminders SET status = 'sent' WHERE id = ANY($1::uuid[]) AND status = 'sending'"
+
+CANCEL_SQL = "UPDATE reminders SET status = 'canceled' WHERE id = ANY($1::uuid[]) AND status = 'sending'"
+
+# 429 от Telegram — не ошибка доставки: вернуть в очередь, попытку не считаем
+REQUEUE_SQL = "UPDATE reminders SET status = 'pending' WHERE id = ANY($1::uuid[]) AND status = 'sending'"
+
+MARK_FAILED_SQL = """
+    UPDATE reminders AS r
+    SET status = 'failed', attempts = r.attempts + 1, last_error = f.err
+    FROM unnest($1::uuid[], $2::text[]) AS f(id, err)
+    WHERE r.id = f.id AND r.status = 'sending'
+"""
+
+
+def asyncpg_dsn(database_url: str) -> str:
+    # DATABASE_URL в формате SQLAlchemy (postgresql+asyncpg://...)
+    return database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def statement_cache_size() -> int:
+    # PgBouncer в transaction pooling: следующий запрос может уйти в другой
+    # серверный backend, где подготовленного statement нет
+    return 0 if cfg.db_pgbouncer else cfg.db_statement_cache_size
+
+
+class ReminderQueue:
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+
+    @classmethod
+    async def connect(cls, min_size: Optional[int] = None, max_size: Optional[int] = None) -> "ReminderQueue":
+        pool = await asyncpg.create_pool(
+            asyncpg_dsn(cfg.database_url),
+            min_size=cfg.db_queue_pool_min if min_size is None else min_size,
+            max_size=cfg.db_queue_pool_max if max_size is None else max_size,
+            statement_cache_size=statement_cache_size(),
+        )
+        return cls(pool)
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def _fetch(self, sql: str, *args):
+        t0 = time.perf_counter()
+        try:
+            return await self.pool.fetch(sql, *args)
+        finally:
+            querytrace.record(time.perf_counter() - t0, sql)
+
+    async def _execute(self, sql: str, *args) -> None:
+        t0 = time.perf_counter()
+        try:
+            await self.pool.execute(sql, *args)
+        finally:
+            querytrace.record(time.perf_counter() - t0, sql)
+
+    async def claim(self, limit: int, now) -> list[uuid.UUID]:
+        return [r["id"] for r in await self._fetch(CLAIM_SQL, limit, now)]
+
+    async def hydrate(self, ids: Sequence[uuid.UUID]) -> list[asyncpg.Record]:
+        if not ids:
+            return []
+        return await self._fetch(HYDRATE_SQL, list(ids))
+
+    async def mark_sent(self, ids: Sequence[uuid.UUID]) -> None:
+        if ids:
+            await self._execute(MARK_SENT_SQL, list(ids))
+
+    async def cancel(self, ids: Sequence[uuid.UUID]) -> None:
+        if ids:
+            await self._execute(CANCEL_SQL, list(ids))
+
+    async def requeue(self, ids: Sequence[uuid.UUID]) -> None:
+        if ids:
+            await self._execute(REQUEUE_SQL, list(ids))
+
+    async def mark_failed(self, ids: Sequence[uuid.UUID], errors: Sequence[Optional[str]]) -> None:
+        if ids:
+            await self._execute(MARK_FAILED_SQL, list(ids), list(errors))
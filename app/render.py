@@ -0,0 +1,172 @@
+import re
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache, wraps
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pydantic import ConfigDict
+
+from app.texts import fmt_date
+
+# Слой отрисовки: тексты и клавиатуры, которые бот шлёт на каждый апдейт.
+# Шаблоны — заранее собранные str.format, поля экранируются один раз
+# (md() с кэшем: имена подписок повторяются из апдейта в апдейт),
+# статические клавиатуры собраны при импорте, а параметризованные
+# склеиваются из готовых рядов без валидации pydantic.
+# Замер: python -m app.bench_render
+
+# parse_mode="Markdown" (legacy): экранировать можно только эти символы
+_MD_SPECIAL = re.compile(r"([_*`\[])")
+
+
+@lru_cache(maxsize=4096)
+def md(value: str) -> str:
+    """Экранирует пользовательское поле для parse_mode="Markdown"."""
+    return _MD_SPECIAL.sub(r"\\\1", value)
+
+
+# --- тексты ---
+
+_LIST_HEADER = "**Активные подписки ({count}):**".format
+_LIST_ROW = "{i}) {name} — {amount} {currency} / {per} ({when}){status}".format
+_LIST_TOTAL = "- {cur}: {monthly:.2f}/мес + {yearly:.2f}/год (≈ {equiv:.2f}/мес), в год: {year:.2f}".format
+_LIST_TOTALS_HEADER = "\n**Итого (по валютам):**"
+_DISABLED = " (выкл. напоминания)"
+
+_CARD = (
+    "**{name}**\n"
+    "Цена: {amount} {currency}\n"
+    "Период: {per}\n"
+    "Дата списания: {when}\n"
+    "Статус: {status}"
+).format
+
+_CONFIRM = "Проверь:\n**{name} — {amount} {currency} — {per} — дата: {when}**".format
+
+_REMINDER = (
+    "{when} списание: **{{name}} — {{amount}} {{currency}}**\n"
+    "Дата: **{{date}}**\n\n"
+    "Бот напоминает о списании. Отменить подписку можно только в самом сервисе."
+)
+# «когда» подставлено заранее: на отправку остаётся один format
+_REMINDER_BY_KIND = {
+    "D3": _REMINDER.format(when="Через 3 дня").format,
+    "D1": _REMINDER.format(when="Завтра").format,
+}
+
+PERIOD_LABELS = {"monthly": "ежемесячно", "yearly": "раз в год"}
+_PER_SHORT = {"monthly": "мес", "yearly": "год"}
+_ZERO = Decimal("0")
+_TWELVE = Decimal("12")
+
+
+def _charge_when(sub, monthly_suffix: str = "") -> str:
+    if sub.billing_period == "monthly":
+        return f"{sub.charge_day}{monthly_suffix}"
+    return f"{sub.charge_dom:02d}.{sub.charge_month:02d}"
+
+
+def subscription_list(subs) -> tuple[list[str], dict[str, dict[str, Decimal]]]:
+    """Строки /list и суммы по валютам (для строки «Всего в …» с курсами)."""
+    totals: dict[str, dict[str, Decimal]] = {}
+    rows = []
+    active_count = 0
+    for i, sub in enumerate(subs, 1):
+        rows.append(_LIST_ROW(
+            i=i, name=md(sub.name), amount=sub.amount, currency=md(sub.currency),
+            per=_PER_SHORT[sub.billing_period], when=_charge_when(sub),
+            status="" if sub.is_active else _DISABLED,
+        ))
+        t = totals.setdefault(sub.currency, {"monthly": _ZERO, "yearly": _ZERO})
+        if sub.is_active:
+            active_count += 1
+            t[sub.billing_period] += Decimal(str(sub.amount))
+
+    lines = [_LIST_HEADER(count=active_count), *rows, _LIST_TOTALS_HEADER]
+    for cur, t in totals.items():
+        monthly, yearly = t["monthly"], t["yearly"]
+        lines.append(_LIST_TOTAL(
+            cur=md(cur), monthly=monthly, yearly=yearly,
+            equiv=yearly / _TWELVE, year=monthly * _TWELVE + yearly,
+        ))
+    return lines, totals
+
+
+def subscription_card(sub) -> str:
+    return _CARD(
+        name=md(sub.name), amount=sub.amount, currency=md(sub.currency),
+        per=PERIOD_LABELS[sub.billing_period], when=_charge_when(sub, " числа"),
+        status="Активна" if sub.is_active else "Напоминания выключены",
+    )
+
+
+def confirm_text(data: dict) -> str:
+    # data — поля AddSub до сохранения
+    if data["period"] == "monthly":
+        when = f"{data['charge_day']} числа"
+    else:
+        when = f"{data['charge_dom']:02d}.{data['charge_month']:02d}"
+    return _CONFIRM(
+        name=md(data["name"]), amount=data["amount"], currency=md(data["currency"]),
+        per=PERIOD_LABELS[data["period"]], when=when,
+    )
+
+
+def reminder_text(kind: str, name: str, amount: str, currency: str, charge_date: date) -> str:
+    render = _REMINDER_BY_KIND.get(kind, _REMINDER_BY_KIND["D1"])
+    return render(name=md(name), amount=amount, currency=md(currency), date=fmt_date(charge_date))
+
+
+# --- клавиатуры ---
+
+class FrozenKeyboard(InlineKeyboardMarkup):
+    """Клавиатура, собранная один раз: общая для всех апдейтов, поэтому неизменяемая."""
+
+    model_config = ConfigDict(frozen=True)
+
+
+def freeze(markup: InlineKeyboardMarkup) -> FrozenKeyboard:
+    return FrozenKeyboard(inline_keyboard=markup.inline_keyboard)
+
+
+def prebuilt(build):
+    """Статическая клавиатура: build() вызывается один раз, при импорте."""
+    markup = freeze(build())
+
+    @wraps(build)
+    def get() -> FrozenKeyboard:
+        return markup
+    return get
+
+
+class RowTemplate:
+    """Ряд кнопок вида (текст, префикс callback_data): на отправку подставляется только id."""
+
+    __slots__ = ("buttons",)
+
+    def __init__(self, *buttons: tuple[str, str]):
+        self.buttons = buttons
+
+    def render(self, arg: str) -> list[InlineKeyboardButton]:
+        # model_construct: тексты и префиксы проверены при сборке шаблона
+        return [InlineKeyboardButton.model_construct(text=t, callback_data=p + arg) for t, p in self.buttons]
+
+
+class ItemRowTemplate:
+    """Ряд из одной кнопки элемента списка: текст — имя элемента, к префиксу callback_data подставляется id."""
+
+    __slots__ = ("prefix",)
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def render(self, text: str, arg: str) -> list[InlineKeyboardButton]:
+        return [InlineKeyboardButton.model_construct(text=text, callback_data=self.prefix + arg)]
+
+
+def static_row(*buttons: tuple[str, str]) -> list[InlineKeyboardButton]:
+    return [InlineKeyboardButton(text=t, callback_data=data) for t, data in buttons]
+
+
+def keyboard(*rows: list[InlineKeyboardButton]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup.model_construct(inline_keyboard=list(rows))
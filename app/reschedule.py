@@ -0,0 +1,88 @@
+import asyncio
+import uuid
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.config import load_config
+from app.dates import utc_now
+from app.db import get_engine, init_db
+
+cfg = load_config()
+
+CHUNK = 500
+
+# Пересчёт remind_at_utc прямо в SQL тем же правилом, что local_remind_at_days()/to_utc():
+# (charge_date - N дней) в reminder_hour по локальному времени пользователя -> naive UTC.
+# Если новое время уже прошло, напоминание отменяем, как create_reminders() его
+# и не создал бы: иначе воркер тут же отправит устаревшее «Через 3 дня».
+# Строки, которые воркер сейчас забирает (FOR UPDATE SKIP LOCKED), пропускаем,
+# а каждая пачка — отдельная короткая транзакция.
+RESCHEDULE_SQL = """
+    WITH picked AS (
+      SELECT r.id
+      FROM reminders r
+      {join}
+      WHERE r.status = 'pending' AND r.id > :after {where}
+      ORDER BY r.id
+      LIMIT :limit
+      FOR UPDATE OF r SKIP LOCKED
+    ),
+    planned AS (
+      SELECT r.id, (
+          (r.charge_date - CASE r.kind WHEN 'D3' THEN 3 ELSE 1 END) + make_time(:hour, 0, 0)
+      ) AT TIME ZONE COALESCE(NULLIF(u.timezone, ''), :default_tz) AT TIME ZONE 'UTC' AS remind_at_utc
+      FROM picked p
+      JOIN reminders r ON r.id = p.id
+      JOIN subscriptions s ON s.id = r.subscription_id
+      JOIN users u ON u.user_id = s.user_id
+    )
+    UPDATE reminders r
+    SET remind_at_utc = CASE WHEN n.remind_at_utc > :now THEN n.remind_at_utc ELSE r.remind_at_utc END,
+        status = CASE WHEN n.remind_at_utc > :now THEN r.status ELSE 'canceled' END
+    FROM planned n
+    WHERE r.id = n.id
+    RETURNING r.id
+"""
+
+_FLEET_SQL = text(RESCHEDULE_SQL.format(join="", where=""))
+_USER_SQL = text(RESCHEDULE_SQL.format(
+    join="JOIN subscriptions us ON us.id = r.subscription_id",
+    where="AND us.user_id = :user_id",
+))
+
+
+async def reschedule_pending(user_id: Optional[int] = None, chunk: int = CHUNK) -> int:
+    """Пересчитывает remind_at_utc pending-напоминаний пользователя (или всех). Возвращает число строк."""
+    if cfg.test_reminders:
+        # в тестовом режиме напоминания в минутах от создания, час и пояс не важны
+        return 0
+
+    sql = _FLEET_SQL if user_id is None else _USER_SQL
+    params = {"hour": cfg.reminder_hour, "default_tz": cfg.default_tz, "limit": chunk, "now": utc_now()}
+    if user_id is not None:
+        params["user_id"] = user_id
+
+    after = uuid.UUID(int=0)
+    total = 0
+    while True:
+        async with get_engine().begin() as conn:
+            ids = (await conn.execute(sql, {**params, "after": after})).scalars().all()
+        if not ids:
+            break
+        total += len(ids)
+        after = max(ids)
+        if len(ids) < chunk:
+            break
+    return total
+
+
+async def main():
+    # после смены REMINDER_HOUR: python -m app.reschedule
+    init_db("cli")
+    total = await reschedule_pending()
+    print(f"rescheduled {total} reminders")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
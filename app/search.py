@@ -0,0 +1,63 @@
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.db import get_engine
+
+# Нечёткий поиск подписок пользователя по имени (/find и inline-режим).
+# Индекс ix_subscriptions_user_name_trgm — GiST (user_id, name gist_trgm_ops)
+# по живым строкам: user_id отсекает чужие подписки в самом индексе
+# (btree_gist), а ORDER BY по расстоянию идёт KNN-обходом — Postgres читает только
+# LIMIT ближайших, сколько бы подписок ни было у пользователя.
+# Колонка слева от операторов (%>, <->> — коммутаторы <%, <<->), иначе
+# планировщик не возьмёт индекс для ORDER BY.
+
+FIND_LIMIT = 10
+INLINE_LIMIT = 20
+MAX_QUERY_LEN = 64
+# word_similarity: «netflx» находит «Netflix Premium», «vpn» — «ProtonVPN»
+SIMILARITY_THRESHOLD = "0.3"
+STATEMENT_TIMEOUT = "250ms"
+
+# SET LOCAL не принимает параметры, set_config(..., true) — то же самое
+SETUP_SQL = text("""
+    SELECT set_config('statement_timeout', :timeout, true),
+           set_config('pg_trgm.word_similarity_threshold', :threshold, true)
+""")
+
+SEARCH_SQL = text("""
+    SELECT id, name, amount, currency, billing_period, is_active,
+           word_similarity(:q, name) AS score
+    FROM subscriptions
+    WHERE user_id = :user_id AND deleted_at IS NULL AND name %> :q
+    ORDER BY name <->> :q
+    LIMIT :limit
+""")
+
+# пустой inline-запрос: ближайшие списания по индексу (user_id, next_charge_date)
+NEAREST_SQL = text("""
+    SELECT id, name, amount, currency, billing_period, is_active, 1.0 AS score
+    FROM subscriptions
+    WHERE user_id = :user_id AND deleted_at IS NULL
+    ORDER BY next_charge_date, id
+    LIMIT :limit
+""")
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+async def search_subscriptions(user_id: int, query: str, limit: int = FIND_LIMIT) -> list:
+    """Подписки пользователя, похожие на query, лучшие первыми. Укладывается в STATEMENT_TIMEOUT."""
+    q = " ".join(query.split())[:MAX_QUERY_LEN]
+    try:
+        async with get_engine().begin() as conn:
+            await conn.execute(SETUP_SQL, {"timeout": STATEMENT_TIMEOUT, "threshold": SIMILARITY_THRESHOLD})
+            if not q:
+                return (await conn.execute(NEAREST_SQL, {"user_id": user_id, "limit": limit})).all()
+            return (await conn.execute(SEARCH_SQL, {"user_id": user_id, "q": q, "limit": limit})).all()
+    except DBAPIError as e:
+        # query_canceled: бюджет времени исчерпан, отвечаем пользователю, а не падаем
+        if getattr(e.orig, "sqlstate", None) == "57014":
+            raise SearchTimeout from e
+        raise
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import calendar
+import json
+import random
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+import asyncpg
+
+from app.config import load_config
+from app.dates import (
+    calc_next_charge_date_monthly, calc_next_charge_date_yearly,
+    local_remind_at_days, to_utc, utc_now,
+)
+from app.reminder_queue import asyncpg_dsn, statement_cache_size
+
+cfg = load_config()
+
+# Синтетические пользователи живут в своём диапазоне id, чтобы их можно было
+# удалить (--reset), не трогая настоящих.
+SEED_USER_BASE = 9_000_000_000_000
+BLOCK_USERS = 2_000
+
+TIMEZONES = [
+    ("Europe/Vilnius", 35), ("Europe/Moscow", 20), ("Europe/Berlin", 10), ("America/New_York", 8),
+    ("Asia/Kolkata", 6), ("America/Los_Angeles", 5), ("Asia/Tokyo", 5), ("Australia/Sydney", 4),
+    ("America/Sao_Paulo", 3), ("Asia/Kathmandu", 2), ("Pacific/Chatham", 2),
+]
+CURRENCIES = [("EUR", 50), ("USD", 30), ("RUB", 15), ("GBP", 5)]
+NAMES = ["Netflix", "Spotify", "iCloud", "YouTube Premium", "VPN", "ChatGPT", "Disney+", "Dropbox",
+         "Notion", "Figma", "Яндекс Плюс", "Кинопоиск", "Adobe CC", "GitHub", "1Password", "Duolingo"]
+
+USER_COLS = ["user_id", "timezone", "default_currency", "created_at"]
+SUB_COLS = ["id", "user_id", "name", "amount", "currency", "billing_period", "charge_day", "charge_month",
+            "charge_dom", "next_charge_date", "is_active", "deleted_at", "created_at", "updated_at"]
+REM_COLS = ["id", "subscription_id", "kind", "charge_date", "remind_at_utc", "status", "attempts",
+            "last_error", "acked_at", "created_at"]
+EVENT_COLS = ["user_id", "event_name", "ts_utc", "props"]
+
+
+def _weighted(rng: random.Random, items):
+    return rng.choices([i for i, _ in items], weights=[w for _, w in items])[0]
+
+
+def _charge_day(rng: random.Random) -> int:
+    # отдельный вес на «трудные» дни: 29–31 зажимаются в коротких месяцах
+    r = rng.random()
+    if r < 0.06:
+        return 31
+    if r < 0.10:
+        return rng.choice((29, 30))
+    return rng.randint(1, 28)
+
+
+def _months_back(d: date, day: int, k: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 - k, 12)
+    return date(y, m + 1, min(day, calendar.monthrange(y, m + 1)[1]))
+
+
+def _subs_count(rng: random.Random, avg: float) -> int:
+    # длинный хвост: 2% «коллекционеров» с 30–80 подписками, остальные ~экспоненциально
+    if rng.random() < 0.02:
+        return rng.randint(30, 80)
+    return min(int(rng.expovariate(1 / max(avg * 0.9 + 0.5, 0.1))), 40)
+
+
+def _gen_block(rng: random.Random, first_uid: int, n_users: int, avg_subs: float, history_months: int,
+               now_utc: datetime, with_events: bool):
+    users, subs, rems, events = [], [], [], []
+    utc = timezone.utc
+
+    for uid in range(first_uid, first_uid + n_users):
+        tz = _weighted(rng, TIMEZONES)
+        now_local = now_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo(tz))
+        created = now_utc - timedelta(days=rng.randint(0, 720))
+        users.append((uid, tz, rng.choice((None, None, "EUR", "USD")), created))
+        if with_events:
+            events.append((uid, "user_started", created.replace(tzinfo=utc), json.dumps({"first": True})))
+
+        for _ in range(_subs_count(rng, avg_subs)):
+            sid = uuid.uuid4()
+            yearly = rng.random() < 0.2
+            day = _charge_day(rng)
+            if yearly:
+                month = rng.randint(1, 12)
+                if rng.random() < 0.03:
+                    month, day = 2, 29
+                next_charge = calc_next_charge_date_yearly(now_local, month, day)
+                charge = (None, month, day)
+            else:
+                next_charge = calc_next_charge_date_monthly(now_local, day)
+                charge = (day, None, None)
+
+            sub_created = min(now_utc, created + timedelta(days=rng.randint(0, 30)))
+            deleted = sub_created + (now_utc - sub_created) * rng.random() if rng.random() < 0.10 else None
+            active = rng.random() >= 0.05
+            amount = Decimal(rng.choice((2.99, 4.99, 9.99, 12.99, 19.99, 99.0, 129.0, 299.0))).quantize(Decimal("0.01"))
+            subs.append((
+                sid, uid, rng.choice(NAMES), amount, _weighted(rng, CURRENCIES),
+                "yearly" if yearly else "monthly", *charge, next_charge, active, deleted, sub_created, sub_created,
+            ))
+            if with_events:
+                events.append((uid, "subscription_added", sub_created.replace(tzinfo=utc),
+                               json.dumps({"period": "yearly" if yearly else "monthly"})))
+
+            # история: прошлые даты списаний с отправленными/отменёнными напоминаниями
+            past = []
+            if yearly:
+                prev = date(next_charge.year - 1, charge[1], min(charge[2], calendar.monthrange(next_charge.year - 1, charge[1])[1]))
+                if (now_utc.date() - prev).days <= history_months * 31:
+                    past.append(prev)
+            else:
+                past = [_months_back(next_charge, day, k) for k in range(1, history_months + 1)]
+
+            # часть подписок с просроченной next_charge_date — работа для rollover
+            stale = bool(past) and deleted is None and active and rng.random() < 0.03
+            if stale:
+                subs[-1] = subs[-1][:9] + (past[0],) + subs[-1][10:]
+
+            for cd in past:
+                acked_d3 = False
+                for kind, days_before in (("D3", 3), ("D1", 1)):
+                    remind = to_utc(local_remind_at_days(cd, days_before, cfg.reminder_hour, tz))
+                    if kind == "D1" and acked_d3:
+                        status, acked = "canceled", None
+                    else:
+                        r = rng.random()
+                        status = "failed" if r < 0.02 else "sent"
+                        acked = remind + timedelta(minutes=rng.randint(1, 600)) if status == "sent" and rng.random() < 0.4 else None
+                        acked_d3 = kind == "D3" and acked is not None
+                    rems.append((uuid.uuid4(), sid, kind, cd, remind, status, 1 if status == "failed" else 0,
+                                 "Forbidden: bot was blocked by the user" if status == "failed" else None,
+                                 acked, remind - timedelta(days=30)))
+
+            # будущие напоминания; небольшая доля «просрочена» — это бэклог очереди
+            if deleted is None and active and not stale:
+                for kind, days_before in (("D3", 3), ("D1", 1)):
+                    remind = to_utc(local_remind_at_days(next_charge, days_before, cfg.reminder_hour, tz))
+                    if remind <= now_utc:
+                        continue
+                    if rng.random() < 0.005:
+                        remind = now_utc - timedelta(minutes=rng.randint(1, 60))
+                    rems.append((uuid.uuid4(), sid, kind, next_charge, remind, "pending", 0, None, None, sub_created))
+
+    return users, subs, rems, events
+
+
+async def reset(conn: asyncpg.Connection) -> None:
+    await conn.execute("""
+        DELETE FROM reminders WHERE subscription_id IN (
+          SELECT id FROM subscriptions WHERE user_id >= $1
+        )
+    """, SEED_USER_BASE)
+    await conn.execute("DELETE FROM subscriptions WHERE user_id >= $1", SEED_USER_BASE)
+    await conn.execute("DELETE FROM events WHERE user_id >= $1", SEED_USER_BASE)
+    await conn.execute("DELETE FROM users WHERE user_id >= $1", SEED_USER_BASE)
+
+
+async def generate(users: int, subs: int, history_months: int, seed: int, with_events: bool) -> None:
+    rng = random.Random(seed)
+    avg_subs = subs / max(users, 1)
+    now_utc = utc_now()
+    conn = await asyncpg.connect(asyncpg_dsn(cfg.database_url), statement_cache_size=statement_cache_size())
+    try:
+        totals = [0, 0, 0, 0]
+        for start in range(0, users, BLOCK_USERS):
+            n = min(BLOCK_USERS, users - start)
+            block = _gen_block(rng, SEED_USER_BASE + start, n, avg_subs, history_months, now_utc, with_events)
+            # COPY пачками по блоку пользователей: память не растёт с размером датасета
+            async with conn.transaction():
+                for table, cols, rows in zip(("users", "subscriptions", "reminders", "events"),
+                                             (USER_COLS, SUB_COLS, REM_COLS, EVENT_COLS), block):
+                    if rows:
+                        await conn.copy_records_to_table(table, records=rows, columns=cols)
+            for i, rows in enumerate(block):
+                totals[i] += len(rows)
+            print(f"\rusers {start + n}/{users}  subs {totals[1]}  reminders {totals[2]}  events {totals[3]}",
+                  end="", flush=True)
+        print()
+        await conn.execute("ANALYZE users; ANALYZE subscriptions; ANALYZE reminders; ANALYZE events;")
+    finally:
+        await conn.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Синтетический датасет для бенчмарков (локальная БД!)")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--subs", type=int, default=1_000_000)
+    parser.add_argument("--history-months", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-events", action="store_true")
+    parser.add_argument("--reset", action="store_true", help="только удалить синтетические данные")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(asyncpg_dsn(cfg.database_url), statement_cache_size=statement_cache_size())
+    try:
+        await reset(conn)
+    finally:
+        await conn.close()
+    if args.reset:
+        return
+
+    await generate(args.users, args.subs, args.history_months, args.seed, not args.no_events)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
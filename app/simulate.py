@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import heapq
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from app.config import load_config
+from app.dates import (
+    REMINDER_OFFSETS, SimClock, iter_charge_dates, local_remind_at_days, now_in,
+    set_clock, to_utc, utc_now,
+)
+from app.handlers import build_subscription, create_reminders
+from app.worker import next_rollover_utc, plan_rollover
+
+cfg = load_config()
+
+_UTC = ZoneInfo("UTC")
+
+# Прогон планировщика на ускоренном времени, без БД и Telegram:
+#   python -m app.simulate --subs 10000 --months 12 --start 2027-10-01
+# Подписки создаются кодом хендлеров (build_subscription/create_reminders),
+# rollover — plan_rollover/next_rollover_utc воркера, часы — SimClock.
+# Время прыгает от события к событию (напоминание или полночь зоны).
+# В конце сверяем: у каждой даты списания ровно один D3 и один D1
+# (D1 отменяется, если D3 подтверждён), в reminder_hour по местному времени.
+
+# зоны с переходами на летнее время в разные даты, с получасовыми сдвигами и без DST
+ZONES = [
+    ("Europe/Vilnius", 30), ("Europe/Moscow", 15), ("America/New_York", 10), ("Australia/Sydney", 8),
+    ("America/Sao_Paulo", 5), ("Pacific/Chatham", 5), ("Asia/Kathmandu", 5), ("America/St_Johns", 5),
+    ("Europe/London", 10), ("UTC", 7),
+]
+
+
+class _Collector:
+    """Вместо AsyncSession для create_reminders(): просто собирает добавленное."""
+
+    def __init__(self):
+        self.added = []
+
+    def add(self, obj) -> None:
+        self.added.append(obj)
+
+
+class Simulation:
+    def __init__(self, start: datetime, ack_rate: float, rng: random.Random):
+        self.clock = SimClock(start)
+        self.ack_rate = ack_rate
+        self.rng = rng
+        self.subs: dict[str, list] = defaultdict(list)  # tz -> подписки
+        self.tz_of: dict[uuid.UUID, str] = {}
+        self.created_at: dict[uuid.UUID, datetime] = {}
+        self.heap: list = []  # (remind_at_utc, seq, Reminder)
+        self.planned: set = set()  # (sub_id, charge_date, kind) — как проверка exists в rollover
+        self.fired: dict[tuple, list[datetime]] = defaultdict(list)
+        self.canceled: set = set()
+        self.acked: set = set()
+        # timezone -> когда следующий rollover; новая зона догоняется сразу, как в refresh_rollover_schedule()
+        self.schedule: dict[str, datetime] = {}
+        self.cpu_by_day: dict = defaultdict(float)
+        self.events = 0
+        self._seq = 0
+
+    def _push(self, r) -> None:
+        key = (r.subscription_id, r.charge_date, r.kind)
+        self.planned.add(key)
+        self._seq += 1
+        heapq.heappush(self.heap, (r.remind_at_utc, self._seq, r))
+
+    async def add_subscription(self, tz: str, data: dict) -> None:
+        # как cb_confirm: дата считается от «сейчас» пользователя
+        sub = build_subscription(0, data, now_in(tz))
+        sub.id = uuid.uuid4()
+        session = _Collector()
+        await create_reminders(session, sub, tz, sub.next_charge_date)
+        for r in session.added:
+            self._push(r)
+        self.subs[tz].append(sub)
+        self.schedule.setdefault(tz, utc_now())
+        self.tz_of[sub.id] = tz
+        self.created_at[sub.id] = utc_now()
+
+    def _rollover(self, tz: str) -> None:
+        now_utc = utc_now()
+        now_local = now_in(tz)
+        today = now_local.date()
+        # тот же фильтр, что rollover_stmt()
+        for sub in self.subs[tz]:
+            if sub.deleted_at is not None or not sub.is_active or sub.next_charge_date >= today:
+                continue
+            next_charge, planned = plan_rollover(sub, tz, now_utc, now_local)
+            sub.next_charge_date = next_charge
+            for kind, remind_utc in planned:
+                if (sub.id, next_charge, kind) in self.planned:
+                    continue
+                r = _Reminder(sub.id, kind, next_charge, remind_utc)
+                self._push(r)
+
+    def _deliver_due(self) -> None:
+        now_utc = utc_now()
+        while self.heap and self.heap[0][0] <= now_utc:
+            _, _, r = heapq.heappop(self.heap)
+            key = (r.subscription_id, r.charge_date, r.kind)
+            # правило HYDRATE_SQL: D1 не шлём, если D3 этой даты подтверждён
+            if r.kind == "D1" and (r.subscription_id, r.charge_date) in self.acked:
+                self.canceled.add(key)
+                continue
+            self.fired[key].append(now_utc)
+            if r.kind == "D3" and self.rng.random() < self.ack_rate:
+                self.acked.add((r.subscription_id, r.charge_date))
+
+    def run(self, end: datetime) -> None:
+        schedule = self.schedule
+        while True:
+            next_reminder = self.heap[0][0] if self.heap else end
+            next_rollover = min(schedule.values(), default=end)
+            t = min(next_reminder, next_rollover)
+            if t > end:
+                break
+            self.clock.set(t)
+
+            cpu0 = time.process_time()
+            for tz, due_at in schedule.items():
+                if due_at <= t:
+                    self._rollover(tz)
+                    schedule[tz] = next_rollover_utc(tz, t)
+            self._deliver_due()
+            self.cpu_by_day[t.date()] += time.process_time() - cpu0
+            self.events += 1
+            if t >= end:
+                break
+        self.clock.set(end)
+
+    def verify(self, end: datetime) -> dict[str, list]:
+        problems: dict[str, list] = defaultdict(list)
+        expected = set()
+        end_date = end.date() + timedelta(days=4)
+        for tz, subs in self.subs.items():
+            for sub in subs:
+                created = self.created_at[sub.id]
+                for charge in iter_charge_dates(
+                    sub.billing_period, sub.charge_day, sub.charge_month, sub.charge_dom,
+                    created.date(), end_date,
+                ):
+                    for kind, days_before in REMINDER_OFFSETS:
+                        local = local_remind_at_days(charge, days_before, cfg.reminder_hour, tz)
+                        remind_utc = to_utc(local)
+                        if not created < remind_utc <= end:
+                            continue
+                        key = (sub.id, charge, kind)
+                        expected.add(key)
+                        fired = self.fired.get(key, [])
+                        if kind == "D1" and (sub.id, charge) in self.acked:
+                            if fired:
+                                problems["D1 sent after D3 ack"].append(key)
+                            continue
+                        if len(fired) != 1:
+                            problems["missing" if not fired else "duplicate"].append((tz, key, fired))
+                            continue
+                        # обратная проверка через зону: ровно reminder_hour нужного дня, в т.ч. у смены DST
+                        local_fired = fired[0].replace(tzinfo=_UTC).astimezone(local.tzinfo)
+                        if fired[0] != remind_utc or (local_fired.date(), local_fired.hour, local_fired.minute) != (
+                            charge - timedelta(days=days_before), cfg.reminder_hour, 0,
+                        ):
+                            problems["wrong time"].append((tz, key, fired[0], remind_utc))
+        for key in self.fired:
+            if key not in expected:
+                problems["unexpected"].append(key)
+        return problems
+
+
+class _Reminder:
+    """Облегчённый Reminder для rollover в симуляции (ORM-объект здесь не нужен)."""
+
+    __slots__ = ("subscription_id", "kind", "charge_date", "remind_at_utc")
+
+    def __init__(self, subscription_id, kind, charge_date, remind_at_utc):
+        self.subscription_id = subscription_id
+        self.kind = kind
+        self.charge_date = charge_date
+        self.remind_at_utc = remind_at_utc
+
+
+def _random_subscription(rng: random.Random) -> dict:
+    day = rng.choice((28, 29, 30, 31)) if rng.random() < 0.3 else rng.randint(1, 27)
+    data = {"name": "sim", "amount": "9.99", "currency": "EUR"}
+    if rng.random() < 0.2:
+        month = rng.randint(1, 12)
+        if rng.random() < 0.15:
+            month, day = 2, 29
+        data.update(period="yearly", charge_month=month, charge_dom=min(day, 31))
+    else:
+        data.update(period="monthly", charge_day=day)
+    return data
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Ускоренная симуляция rollover и напоминаний")
+    parser.add_argument("--subs", type=int, default=10_000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--start", default="2027-10-01", help="UTC-дата старта (через 29.02.2028 и смены DST)")
+    parser.add_argument("--signup-days", type=int, default=30, help="подписки добавляются в течение N дней")
+    parser.add_argument("--ack-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if cfg.test_reminders:
+        sys.exit("TEST_REMINDERS=1: напоминания в минутах, симуляция не имеет смысла")
+
+    rng = random.Random(args.seed)
+    start = datetime.fromisoformat(args.start)
+    end = start + timedelta(days=round(args.months * 30.44))
+    sim = Simulation(start, args.ack_rate, rng)
+    prev_clock = set_clock(sim.clock)
+    try:
+        wall0 = time.perf_counter()
+        # регистрации размазаны по первым дням, чтобы «сейчас» у подписок было разным
+        signups = sorted(start + timedelta(seconds=rng.uniform(0, args.signup_days * 86400)) for _ in range(args.subs))
+        zones = [z for z, _ in ZONES]
+        weights = [w for _, w in ZONES]
+        for at in signups:
+            sim.run(at)
+            await sim.add_subscription(rng.choices(zones, weights=weights)[0], _random_subscription(rng))
+        sim.run(end)
+        wall = time.perf_counter() - wall0
+        problems = sim.verify(end)
+    finally:
+        set_clock(prev_clock)
+
+    days = max(len(sim.cpu_by_day), 1)
+    cpu = sorted(sim.cpu_by_day.values())
+    sent = sum(len(v) for v in sim.fired.values())
+    print(f"{args.subs} subscriptions, {start:%Y-%m-%d} .. {end:%Y-%m-%d} ({days} days) in {wall:.1f} s wall")
+    print(f"reminders sent {sent}, D1 canceled after ack {len(sim.canceled)}, scheduler wakeups {sim.events}")
+    print(f"scheduler CPU per simulated day: mean {sum(cpu) / days * 1000:.1f} ms, "
+          f"p95 {cpu[int(0.95 * (len(cpu) - 1))] * 1000 if cpu else 0:.1f} ms, max {max(cpu, default=0) * 1000:.1f} ms")
+    if problems:
+        for kind, items in problems.items():
+            print(f"FAIL {kind}: {len(items)}, e.g. {items[:3]}")
+        sys.exit(1)
+    print("OK: every charge date got exactly its D3/D1 reminders at the local reminder hour")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from app.db import get_engine
+from app.dates import utc_now
+
+# Сколько последних дней пересчитываем при каждом обновлении:
+# статус напоминания меняется уже после дня remind_at_utc (ретраи, 429).
+# Подтверждения считаем по дню acked_at — поздний «Ок» попадает в свой день.
+LOOKBACK_DAYS = 3
+WINDOW_DAYS = 7
+CACHE_TTL_SECONDS = 30
+
+# Агрегаты по дням (UTC). Каждый запрос ходит по индексу на время,
+# а не по всей таблице.
+REFRESH_SQL = [
+    """
+    INSERT INTO stats_daily (day, metric, kind, value)
+    SELECT (ts_utc AT TIME ZONE 'UTC')::date, 'dau', '', count(DISTINCT user_id)
+    FROM events
+    WHERE ts_utc >= (CAST(:since AS timestamp) AT TIME ZONE 'UTC')
+    GROUP BY 1
+    """,
+    """
+    INSERT INTO stats_daily (day, metric, kind, value)
+    SELECT (ts_utc AT TIME ZONE 'UTC')::date, 'subs_added', '', count(*)
+    FROM events
+    WHERE event_name = 'subscription_added'
+      AND ts_utc >= (CAST(:since AS timestamp) AT TIME ZONE 'UTC')
+    GROUP BY 1
+    """,
+    """
+    INSERT INTO stats_daily (day, metric, kind, value)
+    SELECT day, metric, kind, value
+    FROM (
+      SELECT remind_at_utc::date AS day, kind,
+             count(*) FILTER (WHERE status = 'sent') AS sent,
+             count(*) FILTER (WHERE status = 'failed') AS failed
+      FROM reminders
+      WHERE remind_at_utc >= :since AND remind_at_utc <= :now
+      GROUP BY 1, 2
+    ) r
+    CROSS JOIN LATERAL (VALUES
+      ('reminders_sent', r.sent),
+      ('reminders_failed', r.failed)
+    ) v(metric, value)
+    """,
+    """
+    INSERT INTO stats_daily (day, metric, kind, value)
+    SELECT acked_at::date, 'reminders_acked', kind, count(*)
+    FROM reminders
+    WHERE acked_at >= :since AND acked_at <= :now
+    GROUP BY 1, 3
+    """,
+]
+
+BACKLOG_SQL = text("""
+    SELECT count(*), min(remind_at_utc)
+    FROM reminders
+    WHERE status = 'pending' AND remind_at_utc <= :now
+""")
+
+_cache: Optional[tuple[float, Dict[str, Any]]] = None
+
+
+async def refresh_stats() -> None:
+    """Инкрементально пересчитывает stats_daily (вызывается воркером)."""
+    now = utc_now()
+    async with get_engine().begin() as conn:
+        last_day = (await conn.execute(text("SELECT max(day) FROM stats_daily"))).scalar()
+        if last_day is None:
+            since = datetime(1970, 1, 1)  # первый запуск: полный бэкфилл
+        else:
+            since = datetime.combine(last_day - timedelta(days=LOOKBACK_DAYS), datetime.min.time())
+
+        await conn.execute(text("DELETE FROM stats_daily WHERE day >= :day"), {"day": since.date()})
+        for sql in REFRESH_SQL:
+            await conn.execute(text(sql), {"since": since, "now": now})
+
+
+async def load_stats() -> Dict[str, Any]:
+    """Снимок для /stats: читает только готовые агрегаты, кэшируется на CACHE_TTL_SECONDS."""
+    global _cache
+    if _cache and time.monotonic() - _cache[0] < CACHE_TTL_SECONDS:
+        return _cache[1]
+
+    now = utc_now()
+    today = now.date()
+    since: date = today - timedelta(days=WINDOW_DAYS - 1)
+
+    async with get_engine().connect() as conn:
+        rows = (await conn.execute(
+            text("SELECT day, metric, kind, value FROM stats_daily WHERE day >= :since"),
+            {"since": since},
+        )).all()
+        backlog, oldest = (await conn.execute(BACKLOG_SQL, {"now": now})).one()
+
+    days: Dict[date, Dict[str, int]] = {}
+    reminders: Dict[str, Dict[str, int]] = {}
+    for day, metric, kind, value in rows:
+        if metric.startswith("reminders_"):
+            r = reminders.setdefault(kind, {"sent": 0, "acked": 0, "failed": 0})
+            r[metric.removeprefix("reminders_")] += value
+        else:
+            days.setdefault(day, {})[metric] = value
+
+    snapshot = {
+        "today": days.get(today, {}),
+        "days": days,
+        "reminders": reminders,
+        "backlog": backlog,
+        "lag": (now - oldest) if oldest else timedelta(0),
+        "generated_at": now,
+    }
+    _cache = (time.monotonic(), snapshot)
+    return snapshot
@@ -3,14 +3,6 @@
 def fmt_date(d: date) -> str:
     return d.strftime("%d.%m.%Y")
 
-def reminder_text(kind: str, name: str, amount: str, currency: str, charge_date: date) -> str:
-    when = "Через 3 дня" if kind == "D3" else "Завтра"
-    return (
-        f"{when} списание: **{name} — {amount} {currency}**\n"
-        f"Дата: **{fmt_date(charge_date)}**\n\n"
-        "Бот напоминает о списании. Отменить подписку можно только в самом сервисе."
-    )
-
 APPLE_STEPS = (
     "Как отменить подписку через Apple ID:\n"
     "1) Открой Настройки на iPhone/iPad\n"
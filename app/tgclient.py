@@ -0,0 +1,18 @@
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from app.config import load_config
+
+cfg = load_config()
+
+
+def create_bot(api_base: Optional[str] = None) -> Bot:
+    """Bot для бота и воркера; TELEGRAM_API_BASE направляет запросы на другой сервер Bot API."""
+    base = api_base if api_base is not None else cfg.telegram_api_base
+    if not base:
+        return Bot(token=cfg.bot_token)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base))
+    return Bot(token=cfg.bot_token, session=session)
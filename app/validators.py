@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+
+# Общие правила проверки ввода: и для пошагового AddSub, и для /import.
+
+# Numeric(10, 2) в subscriptions.amount: до 10**8 не включительно
+MAX_AMOUNT = Decimal(10) ** 8
+
+
+def parse_amount(raw: str) -> Decimal | None:
+    try:
+        amount = Decimal(raw.strip().replace(",", "."))
+        if not amount.is_finite():
+            return None
+        # quantize тоже может бросить (1e30 не влезает в точность контекста)
+        amount = amount.quantize(Decimal("0.01"))
+    except Exception:
+        return None
+    # 1e-5 округляется до 0.00 — это не цена
+    return amount if 0 < amount < MAX_AMOUNT else None
+
+
+def parse_currency(raw: str | None) -> str | None:
+    # raw — message.text: у стикера или фото его нет
+    if not raw:
+        return None
+    cur = raw.strip().upper()[:8]
+    return cur if cur.isalpha() else None
+
+
+def parse_day(raw: str | None) -> int | None:
+    if not raw:
+        return None
+    try:
+        d = int(raw.strip())
+    except ValueError:
+        return None
+    return d if 1 <= d <= 31 else None
+
+
+def parse_month(raw: str | None) -> int | None:
+    if not raw:
+        return None
+    try:
+        m = int(raw.strip())
+    except ValueError:
+        return None
+    return m if 1 <= m <= 12 else None
@@ -1,64 +1,86 @@
 ﻿import asyncio
-from datetime import datetime
+import logging
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
 from zoneinfo import ZoneInfo
 
 from aiogram import Bot
-from sqlalchemy import text, select, update
+from aiogram.exceptions import TelegramRetryAfter
+from sqlalchemy import select
 
 from app.config import load_config
-from app.db import SessionLocal
+from app.db import SessionLocal, Wakeup, init_db, liveness_loop, worker_connection_budget
 from app.models import Reminder, Subscription, User
-from app.texts import reminder_text
+from app.stats import refresh_stats, BACKLOG_SQL
+from app.analytics import outbox_depth, relay_outbox
+from app import metrics, querytrace
+from app.broadcast import broadcast_loop
+from app.ratelimit import RateLimiter
+from app.tgclient import create_bot
+from app.reminder_queue import ReminderQueue
+from app.render import reminder_text
 from app.keyboards import ok_kb
-from app.dates import (
-    utc_now, calc_next_charge_date_monthly, calc_next_charge_date_yearly,
-    local_remind_at_days, to_utc
-)
+from app.dates import monotonic, next_charge_on_or_after, plan_reminders, to_utc, utc_now
 
 cfg = load_config()
+logger = logging.getLogger(__name__)
 
 BATCH = 50
 SLEEP_SECONDS = 3
+STATS_REFRESH_SECONDS = 300
+QUEUE_METRICS_SECONDS = 15
+OUTBOX_RELAY_SECONDS = 5
+TZ_REFRESH_SECONDS = 600
+ROLLOVER_RETRY_SECONDS = 600
+ROLLOVER_GRACE = timedelta(minutes=1)
 
-async def rollover_subscriptions():
-    async with SessionLocal() as s:
-        rows = (await s.execute(
-            select(Subscription, User).join(User, User.user_id == Subscription.user_id)
-            .where(
-                Subscription.deleted_at.is_(None),
-                Subscription.is_active.is_(True),
-            )
-        )).all()
+def next_rollover_utc(tz: str, now_utc: datetime) -> datetime:
+    # ближайшая локальная полночь зоны (+ небольшой запас), в naive UTC
+    z = ZoneInfo(tz)
+    now_local = now_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(z)
+    midnight = datetime.combine(now_local.date() + timedelta(days=1), dtime(0, 0), tzinfo=z)
+    return to_utc(midnight) + ROLLOVER_GRACE
 
-        now_utc = utc_now()
+def rollover_stmt(user_tz: str, today_local):
+    return (
+        select(Subscription).join(User, User.user_id == Subscription.user_id)
+        .where(
+            User.timezone == user_tz,
+            Subscription.deleted_at.is_(None),
+            Subscription.is_active.is_(True),
+            # если next_charge_date уже в прошлом, двигаем вперёд
+            Subscription.next_charge_date < today_local,
+        )
+    )
 
-        for sub, u in rows:
-            tz = u.timezone or cfg.default_tz
-            now_local = now_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo(tz))
+def plan_rollover(sub, tz: str, now_utc: datetime, now_local: datetime) -> tuple[date, list[tuple[str, datetime]]]:
+    # чистая часть rollover: новая дата списания и напоминания к ней (без проверки на дубли)
+    next_charge = next_charge_on_or_after(
+        sub.billing_period, sub.charge_day, sub.charge_month, sub.charge_dom, now_local.date(),
+    )
+    if cfg.test_reminders:
+        # В тестовом режиме не плодим rollover reminders бесконечно
+        # (иначе ты утонешь в тестовых уведомлениях)
+        return next_charge, []
+    return next_charge, plan_reminders(next_charge, tz, cfg.reminder_hour, now_utc)
 
-            # если next_charge_date уже в прошлом, двигаем вперёд
-            if sub.next_charge_date >= now_local.date():
-                continue
+async def rollover_timezone(user_tz: str):
+    # user_tz — значение users.timezone как есть (ключ группы)
+    tz = user_tz or cfg.default_tz
+    now_utc = utc_now()
+    # локальная дата считается один раз на зону, а не на каждую строку
+    now_local = now_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo(tz))
 
-            if sub.billing_period == "monthly":
-                next_charge = calc_next_charge_date_monthly(now_local, sub.charge_day)
-            else:
-                next_charge = calc_next_charge_date_yearly(now_local, sub.charge_month, sub.charge_dom)
+    async with SessionLocal() as s:
+        subs = (await s.execute(rollover_stmt(user_tz, now_local.date()))).scalars().all()
 
+        for sub in subs:
+            next_charge, planned = plan_rollover(sub, tz, now_utc, now_local)
             sub.next_charge_date = next_charge
 
             # создаём reminders для нового charge_date (если ещё нет)
-            if cfg.test_reminders:
-                # В тестовом режиме не плодим rollover reminders бесконечно
-                # (иначе ты утонешь в тестовых уведомлениях)
-                continue
-
-            for kind, days_before in [("D3", 3), ("D1", 1)]:
-                local_dt = local_remind_at_days(next_charge, days_before, cfg.reminder_hour, tz)
-                remind_utc = to_utc(local_dt)
-                if remind_utc <= now_utc:
-                    continue
-
+            for kind, remind_utc in planned:
                 exists = (await s.execute(
                     select(Reminder.id).where(
                         Reminder.subscription_id == sub.id,
@@ -82,95 +104,184 @@ async def rollover_subscriptions():
 
         await s.commit()
 
-async def fetch_due_reminders():
-    sql = text("""
-        WITH picked AS (
-          SELECT id
-          FROM reminders
-          WHERE status = 'pending' AND remind_at_utc <= NOW()
-          ORDER BY remind_at_utc
-          LIMIT :limit
-          FOR UPDATE SKIP LOCKED
-        )
-        UPDATE reminders
-        SET status = 'sending'
-        WHERE id IN (SELECT id FROM picked)
-        RETURNING id;
-    """)
+async def load_timezones() -> list[str]:
     async with SessionLocal() as s:
-        rows = (await s.execute(sql, {"limit": BATCH})).all()
-        await s.commit()
-    return [r[0] for r in rows]
+        return list((await s.execute(select(User.timezone).distinct())).scalars().all())
+
+async def rollover_subscriptions():
+    # полный проход по всем зонам (например, вручную или при отладке)
+    for tz in await load_timezones():
+        await rollover_timezone(tz)
+
+async def refresh_rollover_schedule(schedule: dict[str, datetime]):
+    zones = set(await load_timezones())
+    now_utc = utc_now()
+    for tz in zones:
+        # новая зона (или старт воркера): догоняем сразу
+        schedule.setdefault(tz, now_utc)
+    for tz in list(schedule):
+        if tz not in zones:
+            del schedule[tz]
+
+async def run_due_rollovers(schedule: dict[str, datetime]):
+    now_utc = utc_now()
+    for tz, due_at in schedule.items():
+        if due_at > now_utc:
+            continue
+        try:
+            with querytrace.trace(f"rollover:{tz}"):
+                await rollover_timezone(tz)
+            schedule[tz] = next_rollover_utc(tz or cfg.default_tz, now_utc)
+        except Exception:
+            logger.exception("Rollover failed for timezone %r, retrying in %ds", tz, ROLLOVER_RETRY_SECONDS)
+            schedule[tz] = now_utc + timedelta(seconds=ROLLOVER_RETRY_SECONDS)
+
+async def fetch_due_reminders(queue: ReminderQueue):
+    t0 = time.perf_counter()
+    ids = await queue.claim(BATCH, utc_now())
+    metrics.worker_stage_seconds.observe(time.perf_counter() - t0, "claim")
+    return ids
 
-async def send_one(bot: Bot, reminder_id):
+async def update_queue_metrics():
+    now = utc_now()
     async with SessionLocal() as s:
-        r = await s.get(Reminder, reminder_id)
-        if not r or r.status != "sending":
-            return
-
-        sub = await s.get(Subscription, r.subscription_id)
-        if not sub or sub.deleted_at is not None or not sub.is_active:
-            r.status = "canceled"
-            await s.commit()
-            return
-
-        # Вариант B: перед отправкой D1 проверяем, не acked ли D3
-        if r.kind == "D1":
-            d3 = (await s.execute(
-                select(Reminder).where(
-                    Reminder.subscription_id == r.subscription_id,
-                    Reminder.charge_date == r.charge_date,
-                    Reminder.kind == "D3",
-                )
-            )).scalars().first()
-
-            if d3 and d3.acked_at is not None:
-                r.status = "canceled"
-                await s.commit()
-                return
-
-        text_msg = reminder_text(r.kind, sub.name, str(sub.amount), sub.currency, r.charge_date)
+        depth, oldest = (await s.execute(BACKLOG_SQL, {"now": now})).one()
+    metrics.queue_depth.set(depth)
+    metrics.queue_lag.set((now - oldest).total_seconds() if oldest else 0.0)
+    metrics.outbox_depth.set(await outbox_depth())
+
+# сколько исходов копить перед записью статусов. Если воркер упадёт посреди
+# пачки, её незаписанный остаток (отправленные — не больше стольких) так и
+# останется в 'sending': CLAIM_SQL берёт только 'pending', повторно их никто
+# не отправит, статус придётся разбирать вручную
+STATUS_FLUSH_EVERY = 10
+
+async def deliver_batch(bot: Bot, limiter: RateLimiter, queue: ReminderQueue, ids):
+    rows = await queue.hydrate(ids)
 
+    canceled, sent, failed, errors, retry = [], [], [], [], []
+
+    async def flush():
+        # статусы — UPDATE по массиву id на под-пачку вместо commit на каждое напоминание
+        t0 = time.perf_counter()
+        await queue.cancel(canceled)
+        await queue.mark_sent(sent)
+        await queue.mark_failed(failed, errors)
+        await queue.requeue(retry)
+        metrics.worker_stage_seconds.observe(time.perf_counter() - t0, "commit")
+
+        metrics.reminder_sends.inc("canceled", n=len(canceled))
+        metrics.reminder_sends.inc("sent", n=len(sent))
+        metrics.reminder_sends.inc("failed", n=len(failed))
+        metrics.reminder_sends.inc("retry_after", n=len(retry))
+        for done in (canceled, sent, failed, errors, retry):
+            done.clear()
+
+    for r in rows:
+        if len(canceled) + len(sent) + len(failed) + len(retry) >= STATUS_FLUSH_EVERY:
+            await flush()
+
+        # подписка удалена/выключена или (вариант B) D3 уже подтверждён — D1 не шлём
+        if not r["sub_ok"] or r["d3_acked"]:
+            canceled.append(r["id"])
+            continue
+
+        text_msg = reminder_text(r["kind"], r["name"], r["amount"], r["currency"], r["charge_date"])
         try:
+            await limiter.acquire(high=True)
+            t0 = time.perf_counter()
             await bot.send_message(
-                chat_id=sub.user_id,
+                chat_id=r["user_id"],
                 text=text_msg,
-                reply_markup=ok_kb(r.kind, str(r.id)),
+                reply_markup=ok_kb(r["kind"], str(r["id"])),
                 parse_mode="Markdown",
             )
-            r.status = "sent"
-            await s.commit()
+            metrics.worker_stage_seconds.observe(time.perf_counter() - t0, "send")
+            sent.append(r["id"])
+        except TelegramRetryAfter as e:
+            # лимитер ставит на паузу все отправки, остаток пачки дождётся её в acquire()
+            limiter.pause(e.retry_after)
+            retry.append(r["id"])
         except Exception as e:
-            r.status = "failed"
-            r.attempts += 1
-            r.last_error = str(e)[:800]
-            await s.commit()
+            failed.append(r["id"])
+            errors.append(str(e)[:800])
 
-async def loop():
-    bot = Bot(token=cfg.bot_token)
+    await flush()
 
-    last_rollover = 0.0
+async def loop(bot: Bot, limiter: RateLimiter, queue: ReminderQueue, wakeup: Wakeup):
+    # timezone -> когда (UTC) запускать rollover этой зоны
+    rollover_schedule: dict[str, datetime] = {}
+    last_tz_refresh = 0.0
+    last_stats = 0.0
+    last_queue_metrics = 0.0
+    last_relay = 0.0
     while True:
-        now = asyncio.get_event_loop().time()
+        now = monotonic()
 
-        # rollover раз в 10 минут
-        if now - last_rollover > 600:
+        # список зон обновляем раз в 10 минут, rollover зоны — сразу после её полуночи
+        if now - last_tz_refresh > TZ_REFRESH_SECONDS:
             try:
-                await rollover_subscriptions()
+                await refresh_rollover_schedule(rollover_schedule)
             except Exception:
-                pass
-            last_rollover = now
+                logger.exception("Refreshing the rollover schedule failed")
+            last_tz_refresh = now
 
-        ids = await fetch_due_reminders()
-        if not ids:
-            await asyncio.sleep(SLEEP_SECONDS)
-            continue
+        await run_due_rollovers(rollover_schedule)
 
-        for rid in ids:
-            await send_one(bot, rid)
+        # агрегаты для /stats
+        if now - last_stats > STATS_REFRESH_SECONDS:
+            try:
+                await refresh_stats()
+            except Exception:
+                logger.exception("Stats refresh failed")
+            last_stats = now
+
+        # события аналитики из outbox -> events, крупными пачками
+        if now - last_relay > OUTBOX_RELAY_SECONDS:
+            try:
+                await relay_outbox()
+            except Exception:
+                logger.exception("Outbox relay failed")
+            last_relay = now
+
+        if now - last_queue_metrics > QUEUE_METRICS_SECONDS:
+            try:
+                await update_queue_metrics()
+            except Exception:
+                logger.exception("Queue metrics update failed")
+            last_queue_metrics = now
+
+        with querytrace.trace("worker:batch"):
+            ids = await fetch_due_reminders(queue)
+            if ids:
+                await deliver_batch(bot, limiter, queue, ids)
+
+        if not ids:
+            await wakeup.wait(SLEEP_SECONDS)
 
 async def main():
-    await loop()
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stdout,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    init_db("worker")
+    bot = create_bot()
+    # один бюджет отправок на напоминания (высокий приоритет) и рассылки (низкий)
+    limiter = RateLimiter(cfg.send_rate_per_sec)
+    if cfg.metrics_port:
+        await metrics.start_server(cfg.metrics_host, cfg.metrics_port)
+    # очередь напоминаний — на asyncpg, ORM остаётся для rollover/статистики и бота
+    queue = await ReminderQueue.connect()
+    logger.info("DB connection budget: up to %d connections", worker_connection_budget())
+    # NOTIFY из бота (новая рассылка) будит воркер, не дожидаясь таймаута опроса
+    wakeup = Wakeup()
+    await wakeup.start()
+    await asyncio.gather(
+        loop(bot, limiter, queue, wakeup),
+        broadcast_loop(bot, limiter, wakeup),
+        liveness_loop(),
+    )
 
 if __name__ == "__main__":
     asyncio.run(main())